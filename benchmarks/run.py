@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2017 Jakob Kreuze, All Rights Reserved.
+#
+# This file is part of Chandere.
+#
+# Chandere is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Chandere is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Chandere. If not, see <http://www.gnu.org/licenses/>.
+
+"""End-to-end benchmarks for the download and archive_csv actions,
+run against the stand-in API server from the test suite.
+
+Every scenario runs in its own process, with the server in yet another,
+so that peak RSS and CPU time belong to Chandere alone. Results can be
+written as JSON and compared against an earlier run, in which case a
+regression beyond the tolerance makes the exit status nonzero.
+
+    $ python benchmarks/run.py --output new.json --compare old.json
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+
+from chandere import __version__, client  # noqa: E402
+from chandere.loader import load_action, load_scraper  # noqa: E402
+from stub_server import StubServer  # noqa: E402
+
+# Each scenario names the website and target to scrape, the action and
+# its arguments, and the options of the stand-in server. Sizes are
+# multiplied by --scale.
+SCENARIOS = {
+    "thread-archive": {
+        "website": "4chan",
+        "target": ("g", "1000"),
+        "action": "archive_csv",
+        "argv": ["-o", "{out}/posts.csv"],
+        "server": {"threads": 1, "posts_per_thread": 300}
+    },
+    "thread-download": {
+        "website": "4chan",
+        "target": ("g", "1000"),
+        "action": "download",
+        "argv": ["-o", "{out}/{{tim}}.{{ext}}", "-j", "8"],
+        "server": {"threads": 1, "posts_per_thread": 300, "files_every": 1,
+                   "media_size": 64 * 1024}
+    },
+    "board-archive": {
+        "website": "4chan",
+        "target": ("g", None),
+        "action": "archive_csv",
+        "argv": ["-o", "{out}/posts.csv", "--thread-jobs", "8"],
+        "server": {"threads": 150, "posts_per_thread": 100}
+    },
+    "board-download": {
+        "website": "4chan",
+        "target": ("g", None),
+        "action": "download",
+        "argv": ["-o", "{out}/{{tim}}.{{ext}}", "-j", "16",
+                 "--thread-jobs", "8"],
+        "server": {"threads": 150, "posts_per_thread": 20, "files_every": 2,
+                   "media_size": 16 * 1024}
+    },
+    "danbooru-archive": {
+        "website": "danbooru",
+        "target": "touhou",
+        "action": "archive_csv",
+        "argv": ["-o", "{out}/posts.csv"],
+        "server": {"danbooru_posts": 10000}
+    },
+    "danbooru-download": {
+        "website": "danbooru",
+        "target": "touhou",
+        "action": "download",
+        "argv": ["-o", "{out}/{{filename}}.{{ext}}", "-j", "16"],
+        "server": {"danbooru_posts": 10000, "media_size": 4096}
+    }
+}
+
+SCALED_OPTIONS = ["threads", "posts_per_thread", "danbooru_posts"]
+
+# Metrics for which a higher value is better. For every other metric, a
+# higher value is a regression.
+THROUGHPUT_METRICS = ["posts_per_sec", "files_per_sec", "mb_per_sec"]
+
+
+def _serve(options: dict, connection):
+    """Runs a stand-in server until told to stop, reporting its URL and
+    then its statistics through connection.
+    """
+    async def serve():
+        async with StubServer(**options) as server:
+            connection.send(server.url)
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, connection.recv)
+            connection.send({"requests": server.requests,
+                             "bytes_sent": server.bytes_sent})
+
+    asyncio.run(serve())
+
+
+def _count_output(out_dir: str, action: str) -> tuple:
+    """Returns the number of posts or files written and their size."""
+    paths = [os.path.join(out_dir, name) for name in os.listdir(out_dir)]
+    size = sum(os.path.getsize(path) for path in paths)
+    if action == "archive_csv":
+        with open(paths[0]) as archive:
+            return sum(1 for _ in archive) - 1, size
+    return len(paths), size
+
+
+def run_scenario(name: str, scale: float) -> dict:
+    """Runs a single scenario in this process and returns its metrics."""
+    scenario = SCENARIOS[name]
+    options = dict(scenario["server"])
+    for option in SCALED_OPTIONS:
+        if option in options:
+            options[option] = max(1, int(options[option] * scale))
+
+    parent, child = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=_serve, args=(options, child))
+    server.start()
+    url = parent.recv()
+
+    scraper = load_scraper(scenario["website"])
+    scraper.API_BASE = url + "/" + scenario["website"]
+    if hasattr(scraper, "RES_BASE"):
+        scraper.RES_BASE = url + "/" + scenario["website"]
+    action = load_action(scenario["action"])
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        argv = [arg.format(out=out_dir) for arg in scenario["argv"]]
+        if hasattr(scraper, "configure"):
+            scraper.configure(argv)
+
+        async def invoke():
+            async with client.Client():
+                await action.invoke(scraper, [scenario["target"]], argv)
+
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        asyncio.run(invoke())
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+
+        count, size = _count_output(out_dir, scenario["action"])
+
+    parent.send("stop")
+    stats = parent.recv()
+    server.join()
+
+    metrics = {
+        "elapsed": elapsed,
+        "cpu_seconds": cpu,
+        "mb_per_sec": size / elapsed / (1024 * 1024),
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "requests": stats["requests"],
+    }
+    if scenario["action"] == "archive_csv":
+        metrics["posts"] = count
+        metrics["posts_per_sec"] = count / elapsed
+    else:
+        metrics["files"] = count
+        metrics["files_per_sec"] = count / elapsed
+    return metrics
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Returns a description of every metric in results that regressed
+    by more than tolerance relative to baseline.
+    """
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(name, {}).get(metric)
+            if not old or metric in ("elapsed", "posts", "files"):
+                continue
+            if metric in THROUGHPUT_METRICS:
+                regressed = value < old * (1 - tolerance)
+            else:
+                regressed = value > old * (1 + tolerance)
+            if regressed:
+                regressions.append("{}: {} went from {:.2f} to {:.2f}".format(
+                    name, metric, old, value
+                ))
+    return regressions
+
+
+PARSER = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+PARSER.add_argument("scenarios", nargs="*", metavar="SCENARIO",
+                    help="Scenarios to run. Defaults to all of them: "
+                    + ", ".join(SCENARIOS))
+PARSER.add_argument("--scale", type=float, default=1.0,
+                    help="Multiplier for the size of every scenario.")
+PARSER.add_argument("--output", metavar="PATH",
+                    help="Write the results to PATH as JSON.")
+PARSER.add_argument("--compare", metavar="PATH",
+                    help="Compare the results against a previous --output.")
+PARSER.add_argument("--tolerance", type=float, default=0.2,
+                    help="The fraction by which a metric may regress before "
+                    "the comparison fails. Defaults to 0.2.")
+PARSER.add_argument("--in-process", metavar="SCENARIO",
+                    help=argparse.SUPPRESS)
+
+
+def main():
+    args = PARSER.parse_args()
+
+    if args.in_process is not None:
+        json.dump(run_scenario(args.in_process, args.scale), sys.stdout)
+        return 0
+
+    results = {}
+    for name in args.scenarios or SCENARIOS:
+        if name not in SCENARIOS:
+            PARSER.error("unknown scenario '{}'".format(name))
+        output = subprocess.check_output([
+            sys.executable, os.path.abspath(__file__),
+            "--in-process", name, "--scale", str(args.scale)
+        ])
+        results[name] = json.loads(output.decode().splitlines()[-1])
+
+        metrics = results[name]
+        rate = metrics.get("posts_per_sec", metrics.get("files_per_sec"))
+        unit = "posts/s" if "posts_per_sec" in metrics else "files/s"
+        print("{:<18} {:>10.1f} {:<7} {:>8.2f} MB/s {:>8} KB RSS "
+              "{:>6} requests".format(name, rate, unit,
+                                      metrics["mb_per_sec"],
+                                      metrics["peak_rss_kb"],
+                                      metrics["requests"]))
+
+    if args.output is not None:
+        with open(args.output, "w") as output_file:
+            json.dump({"version": __version__, "scale": args.scale,
+                       "results": results}, output_file, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for regression in regressions:
+            print("Regression in " + regression)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
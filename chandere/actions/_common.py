@@ -0,0 +1,338 @@
+# Copyright (C) 2017 Jakob Kreuze, All Rights Reserved.
+#
+# This file is part of Chandere.
+#
+# Chandere is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Chandere is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Chandere. If not, see <http://www.gnu.org/licenses/>.
+
+"""Common functionality for writing action modules."""
+
+from collections import OrderedDict, deque
+import asyncio
+import itertools
+import queue
+import threading
+
+from chandere import client, output
+from chandere.errors import ChandereError
+
+# How many targets are collected at once by default, and how many
+# results each can have waiting to be consumed.
+DEFAULT_TARGET_JOBS = 4
+TARGET_QUEUE_SIZE = 64
+
+# The number of targets collected at once, as given with --target-jobs.
+target_jobs = DEFAULT_TARGET_JOBS
+
+# The number of targets that were skipped after failing, so that the run
+# can still end in failure once the others are done.
+skipped_targets = 0
+
+# The number of the worker process that this is, when running with
+# --workers, out of shard_count, and the outputs it has written copies of
+# in place of those shared with other workers, keyed by the path they
+# stand in for.
+shard_index = None
+shard_count = 1
+shard_outputs = {}
+
+# How many output files an action keeps open at once by default.
+DEFAULT_MAX_OPEN = 64
+
+# How many records are collected, or for how many seconds, before they
+# are handed to the writer thread.
+DEFAULT_FLUSH_SIZE = 512
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+# How many batches can wait for the writer thread before the event loop
+# waits for it in turn.
+DEFAULT_MAX_BATCHES = 8
+
+
+def in_worker() -> bool:
+    """Returns whether or not this is a worker process started with
+    --workers.
+    """
+    return shard_index is not None
+
+
+def shard_suffix() -> str:
+    """Returns a suffix that distinguishes paths written by this worker
+    process from those written by others, or an empty string outside of
+    a worker.
+    """
+    return "" if shard_index is None else ".shard{}".format(shard_index)
+
+
+def shard_sequence(start=1):
+    """Returns an iterator over sequence numbers from start. A worker
+    process takes every shard_count-th number, offset by its own, so
+    that no two workers hand out the same one.
+    """
+    return itertools.count(start + (shard_index or 0), shard_count)
+
+
+def shard_path(path: str) -> str:
+    """Returns the path that should be written in place of one that
+    every worker process would otherwise share, such as an archive.
+    Outside of a worker, this is the path itself. A worker writes a copy
+    of its own, which is merged with the others through the action's
+    merge function once every worker has finished.
+    """
+    if shard_index is None:
+        return path
+    if path not in shard_outputs:
+        shard_outputs[path] = path + shard_suffix()
+    return shard_outputs[path]
+
+
+class HandlePool:
+    """Open output files, keyed by path, of which at most max_open are
+    kept open at once. The least recently used file is closed to make
+    room for another, and reopened for appending if it's needed again.
+
+    open_file is called with a path and a mode of "w" or "a", and must
+    return an object with a close method. The first time a path is
+    opened, its mode is "w", so that it can write a header.
+    """
+    def __init__(self, open_file, max_open=DEFAULT_MAX_OPEN):
+        self.open_file = open_file
+        self.max_open = max_open
+        self.handles = OrderedDict()
+        self.opened = set()
+
+    def get(self, path: str):
+        """Returns the handle for a path, opening it if needed."""
+        handle = self.handles.get(path)
+        if handle is not None:
+            self.handles.move_to_end(path)
+            return handle
+
+        if len(self.handles) >= self.max_open:
+            _, idle = self.handles.popitem(last=False)
+            idle.close()
+
+        mode = "a" if path in self.opened else "w"
+        try:
+            handle = self.open_file(path, mode)
+        except OSError as e:
+            error = "Could not open '{}': {}"
+            raise ChandereError(error.format(path, e.strerror))
+
+        self.opened.add(path)
+        self.handles[path] = handle
+        return handle
+
+    def close(self):
+        """Closes every open handle."""
+        while self.handles:
+            _, handle = self.handles.popitem(last=False)
+            handle.close()
+
+
+class WriterThread:
+    """Writes records on a thread of its own, so that a slow disk doesn't
+    hold up the requests in flight on the event loop. Records are
+    collected into batches, which are handed to the thread once they
+    hold flush_size records or flush_interval seconds have passed. At
+    most max_batches can be waiting at once, after which write waits for
+    the thread to catch up.
+
+    write_batch is called on the thread with each list of records. An
+    error it raises is raised again by the next call to write or close.
+    """
+    def __init__(self, write_batch, flush_size=DEFAULT_FLUSH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 max_batches=DEFAULT_MAX_BATCHES):
+        self.write_batch = write_batch
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.loop = asyncio.get_event_loop()
+        self.slots = asyncio.Semaphore(max_batches)
+        self.queue = queue.Queue()
+        self.batch = []
+        self.error = None
+
+        self.thread = threading.Thread(target=self._run)
+        self.thread.start()
+        self.ticker = asyncio.ensure_future(self._tick())
+
+    def _run(self):
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                return
+            try:
+                if self.error is None:
+                    self.write_batch(batch)
+            except Exception as e:
+                self.error = e
+            finally:
+                self._release()
+
+    def _release(self):
+        try:
+            self.loop.call_soon_threadsafe(self.slots.release)
+        except RuntimeError:
+            # The loop has already been closed, and nothing waits on it.
+            pass
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        """Hands the records collected so far to the thread."""
+        if not self.batch:
+            return
+
+        # The batch is only taken once there is room for it, so a flush
+        # that is cancelled while waiting never holds any records.
+        await self.slots.acquire()
+        batch, self.batch = self.batch, []
+        if batch:
+            self.queue.put(batch)
+        else:
+            # Another flush took the batch while this one waited.
+            self.slots.release()
+
+    async def write(self, record):
+        """Adds a record to the current batch."""
+        if self.error is not None:
+            raise self.error
+        self.batch.append(record)
+        if len(self.batch) >= self.flush_size:
+            await self.flush()
+
+    def close(self):
+        """Writes the remaining records and waits for the thread to
+        finish. This blocks rather than awaiting, so that records still
+        reach the disk when the event loop is being torn down, such as
+        after a KeyboardInterrupt. A flush still waiting for room has not
+        taken any records, so they are written here instead.
+        """
+        self.ticker.cancel()
+        if self.batch:
+            self.queue.put(self.batch)
+            self.batch = []
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+def describe_target(target) -> str:
+    """Returns a readable name for a parsed target."""
+    if isinstance(target, tuple):
+        return "/".join(str(part) for part in target if part is not None)
+    return str(target)
+
+
+class _TargetState:
+    def __init__(self, target):
+        self.target = target
+        self.queue = asyncio.Queue(maxsize=TARGET_QUEUE_SIZE)
+        self.task = None
+        self.done = False
+        self.error = None
+        self.count = 0
+
+
+def _skip_target(target, error: ChandereError):
+    # One target failing shouldn't stop the others, and it can be
+    # collected again with --replay.
+    global skipped_targets
+    skipped_targets += 1
+    output.warning("Skipping target '{}': {}".format(describe_target(target),
+                                                     error))
+    client.dead_letters().record_document(getattr(error, "url", None),
+                                          target, error)
+
+
+def _report_target(target, count: int):
+    output.info("Collected {} results from '{}'.".format(
+        count, describe_target(target)
+    ))
+
+
+async def _produce(state: _TargetState, collect, wake: asyncio.Event):
+    try:
+        async for result in collect(state.target):
+            await state.queue.put(result)
+            wake.set()
+    except ChandereError as e:
+        _skip_target(state.target, e)
+    except Exception as e:
+        state.error = e
+    finally:
+        state.done = True
+        wake.set()
+
+
+async def collect_targets(collect, targets: list, limit=None):
+    """Applies collect, an asynchronous generator function such as a
+    scraper's collect_posts, to every target, yielding (target, result)
+    pairs. Up to limit targets, or target_jobs if not given, are
+    collected at once. Their results are taken in turn, one from each
+    target that has any waiting, so that a large board can't hold up
+    the small ones collected alongside it.
+    """
+    limit = limit or target_jobs
+
+    # Without anything to interleave, the results are passed straight
+    # through rather than queued.
+    if limit == 1 or len(targets) <= 1:
+        for target in targets:
+            count = 0
+            try:
+                async for result in collect(target):
+                    count += 1
+                    yield (target, result)
+            except ChandereError as e:
+                _skip_target(target, e)
+            _report_target(target, count)
+        return
+
+    waiting = deque(targets)
+    active = []
+    wake = asyncio.Event()
+
+    try:
+        while waiting or active:
+            while waiting and len(active) < limit:
+                state = _TargetState(waiting.popleft())
+                state.task = asyncio.ensure_future(
+                    _produce(state, collect, wake)
+                )
+                active.append(state)
+
+            progressed = False
+            for state in list(active):
+                if not state.queue.empty():
+                    state.count += 1
+                    progressed = True
+                    yield (state.target, state.queue.get_nowait())
+                elif state.done:
+                    if state.error is not None:
+                        raise state.error
+                    active.remove(state)
+                    progressed = True
+                    _report_target(state.target, state.count)
+
+            if not progressed:
+                await wake.wait()
+                wake.clear()
+    finally:
+        for state in active:
+            state.task.cancel()
@@ -23,11 +23,16 @@ __version__ = "0.1.0"
 
 import argparse
 import csv
+import os
+import shutil
 
-import aiohttp
-
+from chandere.actions._common import DEFAULT_FLUSH_INTERVAL
+from chandere.actions._common import DEFAULT_FLUSH_SIZE, DEFAULT_MAX_OPEN
+from chandere.actions._common import HandlePool, WriterThread
+from chandere.actions._common import collect_targets, shard_path
 from chandere.cli import wrap
-from chandere.errors import ChandereError, check_http_status
+from chandere.errors import ChandereError
+from chandere.websites import _common as website_common
 
 PARSER = argparse.ArgumentParser(add_help=False)
 PARSER.add_argument(
@@ -55,6 +60,66 @@ PARSER.add_argument(
         "Document me!"
     )
 )
+PARSER.add_argument(
+    "--max-open-files",
+    metavar="N",
+    type=int,
+    default=DEFAULT_MAX_OPEN,
+    help=wrap(
+        "The number of output files to keep open at once, when the output "
+        "template names more than one. Others are closed and reopened as "
+        "needed. Defaults to {}.".format(DEFAULT_MAX_OPEN)
+    )
+)
+
+PARSER.add_argument(
+    "--flush-size",
+    metavar="N",
+    type=int,
+    default=DEFAULT_FLUSH_SIZE,
+    help=wrap(
+        "Posts are written by a separate thread in batches. The number of "
+        "posts to collect before handing them over. Defaults to {}.".format(
+            DEFAULT_FLUSH_SIZE
+        )
+    )
+)
+PARSER.add_argument(
+    "--flush-interval",
+    metavar="SECONDS",
+    type=float,
+    default=DEFAULT_FLUSH_INTERVAL,
+    help=wrap(
+        "The longest that collected posts wait to be handed to the writing "
+        "thread. Defaults to {} second.".format(DEFAULT_FLUSH_INTERVAL)
+    )
+)
+
+
+def _open_mode(path: str, mode: str) -> str:
+    """Returns the mode in which to open an output the first time. Only
+    what has changed is collected when syncing, so rows that earlier runs
+    wrote are kept by appending to existing files.
+    """
+    if mode == "w" and website_common.incremental and os.path.exists(path):
+        return "a"
+    return mode
+
+
+class _Output:
+    """An output file and the CSV writer for it."""
+    def __init__(self, path: str, mode: str, fields: list, header: bool):
+        mode = _open_mode(path, mode)
+        self.handle = open(path, mode, newline="")
+        self.writer = csv.DictWriter(self.handle, fieldnames=fields,
+                                     extrasaction="ignore")
+
+        # Reopened files already have their header.
+        if header and mode == "w":
+            self.writer.writeheader()
+
+    def close(self):
+        self.handle.close()
 
 
 def _parse_format_string(data_format: str):
@@ -71,30 +136,47 @@ async def invoke(scraper: object, targets: list, argv: list):
         raise ChandereError(msg)
 
     args, _ = PARSER.parse_known_args(argv)
-    handles = {}
+    if args.max_open_files < 1:
+        raise ChandereError("The number of open files must be at least 1.")
 
     if args.data_format == "":
         fields = scraper.FIELD_NAMES
     else:
         fields = _parse_format_string(args.data_format)
 
-    for target in targets:
-        async for post in scraper.collect_posts(target):
-            out_path = args.output.format(**post)
+    outputs = HandlePool(
+        lambda path, mode: _Output(path, mode, fields, not args.no_header),
+        args.max_open_files
+    )
 
-            if out_path not in handles:
-                handle = open(out_path, "w+", newline="")
-                writer = csv.DictWriter(handle, fieldnames=fields,
-                                        extrasaction="ignore")
+    # Runs on the writer thread, which alone touches the output files.
+    def write_batch(batch: list):
+        for out_path, post in batch:
+            outputs.get(out_path).writer.writerow(post)
 
-                if not args.no_header:
-                    writer.writeheader()
+    writer = WriterThread(write_batch, args.flush_size, args.flush_interval)
+    try:
+        async for _, post in collect_targets(scraper.collect_posts, targets):
+            out_path = shard_path(args.output.format_map(post))
+            await writer.write((out_path, post))
+    finally:
+        try:
+            writer.close()
+        finally:
+            outputs.close()
 
-                handles[out_path] = (handle, writer)
-            else:
-                _, writer = handles.get(out_path)
 
-            writer.writerow(post)
+def merge(argv: list, outputs: dict):
+    args, _ = PARSER.parse_known_args(argv)
 
-    for handle, _ in handles.values():
-        handle.close()
+    for path, shards in outputs.items():
+        mode = _open_mode(path, "w")
+        with open(path, mode, newline="") as out:
+            for number, shard in enumerate(filter(os.path.exists, shards)):
+                with open(shard, newline="") as shard_file:
+                    # Every worker wrote a header of its own, and an
+                    # existing file already has one.
+                    if (number > 0 or mode == "a") and not args.no_header:
+                        shard_file.readline()
+                    shutil.copyfileobj(shard_file, out)
+                os.remove(shard)
@@ -0,0 +1,314 @@
+# Copyright (C) 2017 Jakob Kreuze, All Rights Reserved.
+#
+# This file is part of Chandere.
+#
+# Chandere is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Chandere is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Chandere. If not, see <http://www.gnu.org/licenses/>.
+
+"""Archive posts as compressed JSON lines."""
+
+__author__ = "Jakob L. Kreuze <jakob@memeware.net>"
+__licence__ = "GPLv3"
+__version__ = "0.1.0"
+
+from collections.abc import Mapping
+import argparse
+import glob
+import gzip
+import json
+import os
+import time
+
+from chandere.actions._common import DEFAULT_FLUSH_INTERVAL
+from chandere.actions._common import DEFAULT_FLUSH_SIZE, WriterThread
+from chandere.actions._common import collect_targets, shard_path
+from chandere.cli import wrap
+from chandere.errors import ChandereError
+from chandere.manifest import target_board
+from chandere.websites._common import Attachment, ATTACHMENT_FIELDS
+
+# Nested fields, such as 8chan's extra files and danbooru's tags, are
+# only available if posts keep the raw fields of the website's API.
+RAW_FIELDS = True
+
+COMPRESSIONS = ["gzip", "zstd", "none"]
+EXTENSIONS = {"gzip": ".gz", "zstd": ".zst", "none": ""}
+
+DEFAULT_ROTATE_SIZE = 256
+
+# Suffix of the index kept next to the archive files.
+INDEX_SUFFIX = ".idx"
+
+PARSER = argparse.ArgumentParser(add_help=False)
+PARSER.add_argument(
+    "-o",
+    "--output",
+    metavar="PATH",
+    default="./posts",
+    help=wrap(
+        "The base path of the archive. Posts are written to numbered files "
+        "such as './posts.0001.jsonl.gz', and an index of them to "
+        "'./posts.idx'. Defaults to './posts'."
+    )
+)
+PARSER.add_argument(
+    "--compression",
+    choices=COMPRESSIONS,
+    default="gzip",
+    help=wrap(
+        "One of 'gzip', 'zstd' or 'none'. Defaults to 'gzip'. zstd requires "
+        "the zstandard package."
+    )
+)
+PARSER.add_argument(
+    "--rotate-size",
+    metavar="MB",
+    type=int,
+    default=DEFAULT_ROTATE_SIZE,
+    help=wrap(
+        "Start a new file once the current one has grown to this many "
+        "megabytes. Defaults to {}.".format(DEFAULT_ROTATE_SIZE)
+    )
+)
+PARSER.add_argument(
+    "--rotate-interval",
+    metavar="SECONDS",
+    type=float,
+    help=wrap(
+        "Start a new file once the current one has been written to for this "
+        "many seconds."
+    )
+)
+PARSER.add_argument(
+    "--flush-size",
+    metavar="N",
+    type=int,
+    default=DEFAULT_FLUSH_SIZE,
+    help=wrap(
+        "The number of posts compressed together. Each such batch can be "
+        "read back on its own. Defaults to {}.".format(DEFAULT_FLUSH_SIZE)
+    )
+)
+PARSER.add_argument(
+    "--flush-interval",
+    metavar="SECONDS",
+    type=float,
+    default=DEFAULT_FLUSH_INTERVAL,
+    help=wrap(
+        "The longest that collected posts wait to be written. Defaults to {} "
+        "second.".format(DEFAULT_FLUSH_INTERVAL)
+    )
+)
+
+
+def _compressor(compression: str):
+    """Returns a function compressing bytes into a self-contained gzip
+    member or zstd frame, which can be decompressed on its own or
+    concatenated with others.
+    """
+    if compression == "gzip":
+        return gzip.compress
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ChandereError("zstd compression requires the zstandard "
+                                "package.")
+        return zstandard.ZstdCompressor().compress
+    return lambda data: data
+
+
+def _decompressor(path: str):
+    if path.endswith(".gz"):
+        return gzip.decompress
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ChandereError("'{}' can't be read without the zstandard "
+                                "package.".format(path))
+        return zstandard.ZstdDecompressor().decompress
+    return lambda data: data
+
+
+def _encode(value):
+    """Converts the values in a post that JSON can't represent."""
+    if isinstance(value, Attachment):
+        # An attachment would otherwise repeat its post's fields.
+        return {field: value[field] for field in ATTACHMENT_FIELDS
+                if field in value}
+    if isinstance(value, Mapping):
+        return dict(value)
+    return str(value)
+
+
+class Archive:
+    """Numbered files of JSON lines, each made up of compressed batches,
+    and an index recording where each batch starts and which threads
+    have posts in it.
+    """
+    def __init__(self, base: str, compression: str, rotate_size: int,
+                 rotate_interval=None):
+        self.base = base
+        self.compress = _compressor(compression)
+        self.extension = EXTENSIONS[compression]
+        self.rotate_size = rotate_size
+        self.rotate_interval = rotate_interval
+        self.handle = None
+        self.opened = None
+
+        # Later runs add files rather than overwriting earlier ones.
+        numbers = [int(path[len(base) + 1:].split(".")[0])
+                   for path in glob.glob(glob.escape(base) + ".[0-9]*")]
+        self.number = max(numbers, default=0)
+
+        try:
+            self.index = open(base + INDEX_SUFFIX, "a")
+        except OSError as e:
+            error = "Could not open index '{}': {}"
+            raise ChandereError(error.format(base + INDEX_SUFFIX, e.strerror))
+
+    def _rotate(self):
+        if self.handle is not None:
+            self.handle.close()
+        self.number += 1
+        path = "{}.{:04}.jsonl{}".format(self.base, self.number,
+                                         self.extension)
+        self.handle = open(path, "wb")
+        self.opened = time.monotonic()
+
+    def _due(self) -> bool:
+        if self.handle is None:
+            return True
+        if self.handle.tell() >= self.rotate_size:
+            return True
+        return self.rotate_interval is not None and \
+            time.monotonic() - self.opened >= self.rotate_interval
+
+    def write(self, batch: list):
+        """Writes a batch of (board, post) records as one compressed
+        block, and records it in the index.
+        """
+        if self._due():
+            self._rotate()
+
+        threads = set()
+        lines = []
+        for board, post in batch:
+            lines.append(json.dumps(post, default=_encode))
+            if post.get("thread") is not None:
+                threads.add((board, post.get("thread")))
+        block = self.compress("\n".join(lines).encode("utf-8") + b"\n")
+
+        offset = self.handle.tell()
+        self.handle.write(block)
+        self.handle.flush()
+        self.index.write(json.dumps({
+            "file": os.path.basename(self.handle.name),
+            "offset": offset,
+            "size": len(block),
+            "threads": sorted(threads, key=str)
+        }) + "\n")
+        self.index.flush()
+
+    def merge(self, base: str):
+        """Moves the files of the archive at base, which must be in the
+        same directory, onto the end of this one, and adds their blocks
+        to the index.
+        """
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+        directory = os.path.dirname(self.base)
+        prefix = os.path.basename(base) + "."
+        renamed = {}
+        with open(base + INDEX_SUFFIX) as index:
+            for line in index:
+                block = json.loads(line)
+                name = block["file"]
+                if name not in renamed:
+                    # Such as "posts.shard1.0003.jsonl.gz" to
+                    # "posts.0012.jsonl.gz".
+                    self.number += 1
+                    suffix = name[len(prefix):].split(".", 1)[1]
+                    renamed[name] = "{}.{:04}.{}".format(
+                        os.path.basename(self.base), self.number, suffix
+                    )
+                    os.replace(os.path.join(directory, name),
+                               os.path.join(directory, renamed[name]))
+                block["file"] = renamed[name]
+                self.index.write(json.dumps(block) + "\n")
+        self.index.flush()
+        os.remove(base + INDEX_SUFFIX)
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+        self.index.close()
+
+
+def read_thread(base: str, board: str, thread):
+    """Yields the archived posts of a thread, decompressing only the
+    blocks that the index says hold some of them.
+    """
+    directory = os.path.dirname(base)
+    with open(base + INDEX_SUFFIX) as index:
+        for line in index:
+            block = json.loads(line)
+            if [board, thread] not in block["threads"]:
+                continue
+
+            path = os.path.join(directory, block["file"])
+            with open(path, "rb") as archive:
+                archive.seek(block["offset"])
+                data = _decompressor(path)(archive.read(block["size"]))
+            for post_line in data.decode("utf-8").splitlines():
+                post = json.loads(post_line)
+                if post.get("thread") == thread:
+                    yield post
+
+
+async def invoke(scraper: object, targets: list, argv: list):
+    if not hasattr(scraper, "collect_posts"):
+        msg = "'{}' module cannot collect posts.".format(scraper.__name__)
+        raise ChandereError(msg)
+
+    args, _ = PARSER.parse_known_args(argv)
+    archive = Archive(shard_path(args.output), args.compression,
+                      args.rotate_size * 1024 * 1024, args.rotate_interval)
+
+    writer = WriterThread(archive.write, args.flush_size, args.flush_interval)
+    try:
+        async for target, post in collect_targets(scraper.collect_posts,
+                                                  targets):
+            await writer.write((target_board(target), post))
+    finally:
+        try:
+            writer.close()
+        finally:
+            archive.close()
+
+
+def merge(argv: list, outputs: dict):
+    args, _ = PARSER.parse_known_args(argv)
+
+    for base, shards in outputs.items():
+        archive = Archive(base, args.compression,
+                          args.rotate_size * 1024 * 1024, args.rotate_interval)
+        try:
+            for shard in shards:
+                if os.path.exists(shard + INDEX_SUFFIX):
+                    archive.merge(shard)
+        finally:
+            archive.close()
@@ -0,0 +1,238 @@
+# Copyright (C) 2017 Jakob Kreuze, All Rights Reserved.
+#
+# This file is part of Chandere.
+#
+# Chandere is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Chandere is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Chandere. If not, see <http://www.gnu.org/licenses/>.
+
+"""Archive posts to an SQLite database."""
+
+__author__ = "Jakob L. Kreuze <jakob@memeware.net>"
+__licence__ = "GPLv3"
+__version__ = "0.1.0"
+
+import argparse
+import os
+import sqlite3
+
+from chandere.actions._common import DEFAULT_FLUSH_INTERVAL
+from chandere.actions._common import DEFAULT_FLUSH_SIZE, WriterThread
+from chandere.actions._common import collect_targets, in_worker
+from chandere.actions._common import shard_path
+from chandere.cli import wrap
+from chandere.errors import ChandereError
+from chandere.manifest import target_board
+
+# The fields of a post that are archived, besides its id.
+FIELDS = ("thread", "time_posted", "name", "title", "comment", "filename",
+          "ext", "fsize", "md5")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    site TEXT NOT NULL,
+    board TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    thread INTEGER,
+    time_posted INTEGER,
+    name TEXT,
+    title TEXT,
+    comment TEXT,
+    filename TEXT,
+    ext TEXT,
+    fsize INTEGER,
+    md5 TEXT,
+    UNIQUE (site, board, id)
+);
+CREATE INDEX IF NOT EXISTS posts_thread ON posts (site, board, thread);
+CREATE INDEX IF NOT EXISTS posts_time ON posts (time_posted);
+"""
+
+# A full-text index of the posts table, kept up to date by triggers as
+# posts are inserted, updated and deleted.
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE posts_fts USING fts5 (
+    name, title, comment, content = 'posts', content_rowid = 'rowid'
+);
+CREATE TRIGGER posts_fts_insert AFTER INSERT ON posts BEGIN
+    INSERT INTO posts_fts (rowid, name, title, comment)
+    VALUES (new.rowid, new.name, new.title, new.comment);
+END;
+CREATE TRIGGER posts_fts_delete AFTER DELETE ON posts BEGIN
+    INSERT INTO posts_fts (posts_fts, rowid, name, title, comment)
+    VALUES ('delete', old.rowid, old.name, old.title, old.comment);
+END;
+CREATE TRIGGER posts_fts_update AFTER UPDATE ON posts BEGIN
+    INSERT INTO posts_fts (posts_fts, rowid, name, title, comment)
+    VALUES ('delete', old.rowid, old.name, old.title, old.comment);
+    INSERT INTO posts_fts (rowid, name, title, comment)
+    VALUES (new.rowid, new.name, new.title, new.comment);
+END;
+INSERT INTO posts_fts (posts_fts) VALUES ('rebuild');
+"""
+
+# Posts that are already archived are only written again if something
+# about them has changed, such as a comment being edited.
+ON_CONFLICT = """ON CONFLICT (site, board, id) DO UPDATE SET {updates}
+WHERE {changed}
+""".format(
+    updates=", ".join("{0} = excluded.{0}".format(field) for field in FIELDS),
+    changed=" OR ".join("{0} IS NOT excluded.{0}".format(field)
+                        for field in FIELDS)
+)
+
+UPSERT = """
+INSERT INTO posts (site, board, id, {fields}) VALUES (?, ?, ?, {values})
+""".format(
+    fields=", ".join(FIELDS),
+    values=", ".join("?" for _ in FIELDS)
+) + ON_CONFLICT
+
+# Copies the posts of an attached database named "other". The WHERE
+# clause keeps SQLite from reading ON CONFLICT as part of a join.
+MERGE = """
+INSERT INTO posts (site, board, id, {fields})
+SELECT site, board, id, {fields} FROM other.posts WHERE true
+""".format(fields=", ".join(FIELDS)) + ON_CONFLICT
+
+PARSER = argparse.ArgumentParser(add_help=False)
+PARSER.add_argument(
+    "-o",
+    "--output",
+    metavar="PATH",
+    default="./posts.db",
+    help=wrap(
+        "The database to archive posts to, which is created if it doesn't "
+        "exist. Defaults to './posts.db'."
+    )
+)
+PARSER.add_argument(
+    "--search-index",
+    action="store_true",
+    help=wrap(
+        "Maintain a full-text index of the archived posts, for use with "
+        "'chandere search'. Posts archived before the index was created are "
+        "indexed the first time this is given."
+    )
+)
+PARSER.add_argument(
+    "--flush-size",
+    metavar="N",
+    type=int,
+    default=DEFAULT_FLUSH_SIZE,
+    help=wrap(
+        "The number of posts to write in a single transaction. Defaults to "
+        "{}.".format(DEFAULT_FLUSH_SIZE)
+    )
+)
+PARSER.add_argument(
+    "--flush-interval",
+    metavar="SECONDS",
+    type=float,
+    default=DEFAULT_FLUSH_INTERVAL,
+    help=wrap(
+        "The longest that collected posts wait to be written. Defaults to {} "
+        "second.".format(DEFAULT_FLUSH_INTERVAL)
+    )
+)
+
+
+def has_search_index(connection) -> bool:
+    """Returns whether or not an archive has a full-text index."""
+    cursor = connection.execute("SELECT 1 FROM sqlite_master WHERE "
+                                "type = 'table' AND name = 'posts_fts'")
+    return cursor.fetchone() is not None
+
+
+def _column(value):
+    """Converts a field to a type that SQLite can store."""
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+
+class Archive:
+    """An SQLite database of posts, keyed by the site and board they
+    were found in along with their id. Posts are written in batches, each
+    in a transaction of its own.
+    """
+    def __init__(self, path: str, search_index=False):
+        try:
+            # The connection is opened here, so that errors surface
+            # straight away, but used by the writer thread from then on.
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.executescript(SCHEMA)
+            if search_index and not has_search_index(self.connection):
+                self.connection.executescript(SEARCH_SCHEMA)
+        except sqlite3.Error as e:
+            error = "Could not open archive '{}': {}"
+            raise ChandereError(error.format(path, e))
+
+    def write(self, batch: list):
+        """Inserts or updates a batch of (site, board, post) records."""
+        rows = ((site, board, _column(post.get("id")))
+                + tuple(_column(post.get(field)) for field in FIELDS)
+                for site, board, post in batch)
+        with self.connection:
+            self.connection.executemany(UPSERT, rows)
+
+    def merge(self, path: str):
+        """Inserts or updates the posts of the archive at path."""
+        try:
+            self.connection.execute("ATTACH DATABASE ? AS other", (path,))
+            with self.connection:
+                self.connection.execute(MERGE)
+            self.connection.execute("DETACH DATABASE other")
+        except sqlite3.Error as e:
+            error = "Could not merge archive '{}': {}"
+            raise ChandereError(error.format(path, e))
+
+    def close(self):
+        self.connection.close()
+
+
+async def invoke(scraper: object, targets: list, argv: list):
+    if not hasattr(scraper, "collect_posts"):
+        msg = "'{}' module cannot collect posts.".format(scraper.__name__)
+        raise ChandereError(msg)
+
+    args, _ = PARSER.parse_known_args(argv)
+    site = scraper.__name__.rsplit(".", 1)[-1]
+    # Only the merged archive needs a full-text index.
+    archive = Archive(shard_path(args.output),
+                      args.search_index and not in_worker())
+
+    writer = WriterThread(archive.write, args.flush_size, args.flush_interval)
+    try:
+        async for target, post in collect_targets(scraper.collect_posts,
+                                                  targets):
+            await writer.write((site, target_board(target), post))
+    finally:
+        try:
+            writer.close()
+        finally:
+            archive.close()
+
+
+def merge(argv: list, outputs: dict):
+    args, _ = PARSER.parse_known_args(argv)
+
+    for path, shards in outputs.items():
+        archive = Archive(path, args.search_index)
+        try:
+            for shard in filter(os.path.exists, shards):
+                archive.merge(shard)
+                os.remove(shard)
+        finally:
+            archive.close()
@@ -22,11 +22,30 @@ __licence__ = "GPLv3"
 __version__ = "0.1.0"
 
 import argparse
+import asyncio
+import hashlib
+import os
+import re
+import string
 
 import aiohttp
 
+from chandere import client, output
+from chandere.actions._common import collect_targets, in_worker
+from chandere.actions._common import shard_path, shard_sequence
+from chandere.actions._common import shard_suffix
 from chandere.cli import wrap
-from chandere.errors import ChandereError, check_http_status
+from chandere.errors import ChandereError, HTTPError, check_http_status
+from chandere.manifest import Manifest, target_board
+from chandere.retry import REPLAY_FILES, retry
+from chandere.store import LINK_MODES, BlobStore
+
+# Response bodies are written to disk in pieces of this size, which
+# bounds the memory used by each download in flight.
+CHUNK_SIZE = 64 * 1024
+
+# Suffix for files that are still being written.
+PARTIAL_SUFFIX = ".part"
 
 PARSER = argparse.ArgumentParser(add_help=False)
 PARSER.add_argument(
@@ -40,15 +59,239 @@ PARSER.add_argument(
         "working directory. See the manpage for specific details on usage."
     )
 )
+PARSER.add_argument(
+    "-j",
+    "--jobs",
+    metavar="N",
+    type=int,
+    default=1,
+    help=wrap(
+        "The number of files to download at the same time. Defaults to 1."
+    )
+)
+PARSER.add_argument(
+    "--store",
+    metavar="DIR",
+    help=wrap(
+        "A directory in which to keep a single copy of every file, named by "
+        "its MD5 digest. Files already in the store are not downloaded "
+        "again, and output paths are linked to the stored copy."
+    )
+)
+PARSER.add_argument(
+    "--link",
+    metavar="MODE",
+    choices=LINK_MODES,
+    default="hardlink",
+    help=wrap(
+        "How output paths refer to files in the store. One of 'hardlink', "
+        "'symlink' or 'reflink'. Defaults to 'hardlink'."
+    )
+)
+PARSER.add_argument(
+    "--manifest",
+    metavar="PATH",
+    help=wrap(
+        "An SQLite database recording every file that has been downloaded. "
+        "Files that a previous run completed are skipped without making a "
+        "request."
+    )
+)
+
+
+def _partial_size(path: str) -> int:
+    """Returns the size of a partially downloaded file, or 0 if there is
+    nothing to resume from.
+    """
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _content_range_start(header: str):
+    """Parses the first byte position from a Content-Range header such
+    as "bytes 200-1023/1024", returning None if it can't be parsed.
+    """
+    try:
+        unit, spec = header.split(" ", 1)
+        if unit != "bytes":
+            return None
+        return int(spec.split("-", 1)[0])
+    except (AttributeError, ValueError):
+        return None
 
 
-async def _download_file(uri: str, out_path: str):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(uri) as response:
+def _hash_file(path: str):
+    """Returns an MD5 hash object fed with the contents of a file."""
+    md5 = hashlib.md5()
+    with open(path, "rb") as partial:
+        for chunk in iter(lambda: partial.read(CHUNK_SIZE), b""):
+            md5.update(chunk)
+    return md5
+
+
+async def _fetch(uri: str, partial_path: str, offset: int, hashing=False):
+    """Writes the resource at the given URI to partial_path, asking the
+    server for only the bytes following offset if it is nonzero. If
+    hashing, returns an MD5 hash object of the whole file.
+    """
+    headers = {"Range": "bytes={}-".format(offset)} if offset > 0 else {}
+
+    async with client.get(uri, headers=headers) as response:
+        if response.status == 416 and offset > 0:
+            # Whatever we had doesn't match the resource anymore.
+            return await _fetch(uri, partial_path, 0, hashing)
+
+        start = _content_range_start(response.headers.get("Content-Range"))
+        resumed = response.status == 206 and offset > 0 and start == offset
+        if not resumed:
+            # The range was ignored, so the whole body is coming.
             check_http_status(response.status, uri)
-            # TODO: Perform chunked writing.;
-            with open(out_path, "wb+") as out:
-                out.write(await response.read())
+
+        md5 = None
+        if hashing:
+            md5 = _hash_file(partial_path) if resumed else hashlib.md5()
+
+        with open(partial_path, "ab" if resumed else "wb") as out:
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                out.write(chunk)
+                if md5 is not None:
+                    md5.update(chunk)
+
+        return md5
+
+
+async def _download_file(uri: str, out_path: str, size=None, digest=None):
+    """Downloads the resource at the given URI to out_path. A partial
+    download left behind by a previous run is resumed rather than
+    fetched again. If the expected size or hexadecimal MD5 digest is
+    known, the result is checked against it before the file is moved
+    into place.
+    """
+    # Worker processes that come across the same file each write a
+    # partial copy of their own, and whichever finishes last moves its
+    # copy into place.
+    partial_path = out_path + shard_suffix() + PARTIAL_SUFFIX
+    offset = _partial_size(partial_path)
+
+    if size is not None and offset > size:
+        offset = 0
+
+    # A previous run may have finished the body but not the rename.
+    md5 = None
+    if size is None or offset < size:
+        md5 = await _fetch(uri, partial_path, offset, digest is not None)
+
+    received = _partial_size(partial_path)
+    if size is not None and received != size:
+        # A short file is kept so that a retry can resume it.
+        if received > size:
+            os.remove(partial_path)
+        error = "Expected {} bytes but received {} while fetching '{}'."
+        raise HTTPError(error.format(size, received, uri), uri)
+
+    if digest is not None:
+        if md5 is None:
+            md5 = _hash_file(partial_path)
+        if md5.hexdigest() != digest.lower():
+            # The body can't be trusted, so there's nothing to resume.
+            os.remove(partial_path)
+            error = "Expected MD5 digest {} but received {} while fetching " \
+                    "'{}'."
+            raise HTTPError(error.format(digest, md5.hexdigest(), uri), uri)
+
+    # The file only appears under its final name once it is complete.
+    os.replace(partial_path, out_path)
+
+
+async def _download_stored(uri: str, out_path: str, size, digest: str,
+                           store: BlobStore, pending: dict):
+    """Ensures the blob for a digest is in the store, downloading it if
+    it isn't, and links out_path to it. Resources sharing a digest that
+    are requested while the blob is still downloading wait for that
+    download rather than starting another.
+    """
+    if not store.contains(digest):
+        if digest not in pending:
+            blob_path = store.blob_path(digest)
+            # Every later link reuses the blob, so its contents are
+            # checked against the digest it is named by.
+            download = _download_file(uri, blob_path, size, digest)
+            pending[digest] = asyncio.ensure_future(download)
+        try:
+            await pending[digest]
+        finally:
+            pending.pop(digest, None)
+
+    store.link(digest, out_path)
+
+
+async def _download_resource(uri: str, out_path: str, post: dict,
+                             store=None, pending=None):
+    """Downloads a file, through the store if there is one and the post
+    gives the file's digest.
+    """
+    size, digest = post.get("fsize"), post.get("md5")
+    if store is not None and digest:
+        await _download_stored(uri, out_path, size, digest, store, pending)
+    else:
+        await _download_file(uri, out_path, size)
+
+
+async def _download_worker(queue: asyncio.Queue, store=None, pending=None,
+                           manifest=None):
+    """Downloads queued (uri, out_path, post, key) jobs until a None
+    sentinel is received. Transient failures are retried, and a download
+    that still fails is reported and recorded in the dead-letter list so
+    that it does not take the other workers down with it.
+    """
+    retries = client.current().retries
+
+    while True:
+        job = await queue.get()
+        try:
+            if job is None:
+                return
+            uri, out_path, post, key = job
+            await retry(
+                lambda: _download_resource(uri, out_path, post, store,
+                                           pending),
+                retries,
+                "'{}'".format(uri)
+            )
+            if manifest is not None:
+                size = os.path.getsize(out_path)
+                manifest.record(key, out_path, size, complete=True)
+        except (ChandereError, aiohttp.ClientError, asyncio.TimeoutError,
+                OSError) as e:
+            error = str(e) or type(e).__name__
+            output.warning("Failed to download '{}': {}".format(uri, error))
+            client.dead_letters().record_file(uri, post, error, key)
+            if manifest is not None:
+                manifest.record(key, out_path, complete=False)
+        finally:
+            queue.task_done()
+
+
+def _uses_index(template: str) -> bool:
+    """Returns whether or not an output template refers to {index}."""
+    fields = (field for _, field, _, _ in string.Formatter().parse(template)
+              if field)
+    return any(re.match(r"index\b", field) for field in fields)
+
+
+def _manifest_key(scraper: object, target, post: dict, uri: str) -> tuple:
+    """Returns the key identifying a file in the manifest."""
+    if target == REPLAY_FILES:
+        # The pseudo-target says nothing of the file's board, so the
+        # key that the file failed under is used again.
+        key = scraper.file_key(uri)
+        if key is not None:
+            return key
+    site = scraper.__name__.rsplit(".", 1)[-1]
+    return (site, target_board(target), str(post.get("id")),
+            post.get("md5") or uri)
 
 
 async def invoke(scraper: object, targets: list, argv: list):
@@ -57,12 +300,73 @@ async def invoke(scraper: object, targets: list, argv: list):
         raise ChandereError(msg)
 
     args, _ = PARSER.parse_known_args(argv)
-    seq_index = 1
-
-    for target in targets:
-        async for resource in scraper.collect_files(target):
-            post, uri = resource
-            post["index"] = seq_index
-            out_path = args.output.format(**post)
-            seq_index += 1
-            await _download_file(uri, out_path)
+    if args.jobs < 1:
+        raise ChandereError("The number of jobs must be at least 1.")
+
+    store = BlobStore(args.store, args.link) if args.store else None
+    manifest = None
+    if args.manifest:
+        base = args.manifest if in_worker() else None
+        manifest = Manifest(shard_path(args.manifest), base)
+    pending = {}
+
+    # Bounding the queue keeps the scraper from running arbitrarily far
+    # ahead of the workers.
+    queue = asyncio.Queue(maxsize=args.jobs * 2)
+    workers = [
+        asyncio.ensure_future(
+            _download_worker(queue, store, pending, manifest)
+        )
+        for _ in range(args.jobs)
+    ]
+
+    # Indices are handed out in the order that files are collected in,
+    # which only stays the same from run to run if targets are collected
+    # one at a time.
+    limit = 1 if _uses_index(args.output) else None
+
+    async def produce():
+        indices = shard_sequence()
+        resources = collect_targets(scraper.collect_files, targets, limit)
+        async for target, (post, uri) in resources:
+            post["index"] = next(indices)
+            out_path = args.output.format_map(post)
+
+            # The key is kept with a failed download even without a
+            # manifest, so that a replay can record it under the right one.
+            key = _manifest_key(scraper, target, post, uri)
+            if manifest is not None and \
+               manifest.is_complete(key, out_path) and \
+               os.path.exists(out_path):
+                continue
+
+            await queue.put((uri, out_path, post, key))
+
+        for _ in workers:
+            await queue.put(None)
+
+    tasks = [asyncio.ensure_future(produce())] + workers
+    try:
+        # A worker that dies of an unexpected error takes the run down
+        # with it, rather than leaving the scraper waiting on a queue that
+        # nothing is reading from.
+        done, _ = await asyncio.wait(tasks,
+                                     return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        if manifest is not None:
+            manifest.close()
+
+
+def merge(argv: list, outputs: dict):
+    for path, shards in outputs.items():
+        manifest = Manifest(path)
+        try:
+            for shard in filter(os.path.exists, shards):
+                manifest.merge(shard)
+                os.remove(shard)
+        finally:
+            manifest.close()
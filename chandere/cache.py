@@ -0,0 +1,122 @@
+# Copyright (C) 2017 Jakob Kreuze, All Rights Reserved.
+#
+# This file is part of Chandere.
+#
+# Chandere is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Chandere is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Chandere. If not, see <http://www.gnu.org/licenses/>.
+
+"""An on-disk cache of decoded API responses. Entries expire after a
+time-to-live chosen by whoever stores them, and once the cache grows
+past its size limit, the least recently used entries are evicted.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+from chandere.errors import ChandereError
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# A time-to-live for documents that will never change, such as archived
+# threads.
+FOREVER = float("inf")
+
+
+class ResponseCache:
+    """A directory of JSON documents, one file per key. A file's
+    modification time doubles as the time it was last used, so the
+    least recently used entries can be found without an index.
+    """
+    def __init__(self, root: str, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+
+        try:
+            os.makedirs(root, exist_ok=True)
+            self.size = sum(entry.stat().st_size
+                            for entry in os.scandir(root)
+                            if entry.name.endswith(".json"))
+        except OSError as e:
+            error = "Could not open cache directory '{}': {}"
+            raise ChandereError(error.format(root, e.strerror))
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, digest + ".json")
+
+    def get(self, key: str):
+        """Returns the document stored under a key, or None if there is
+        no such entry or it has expired.
+        """
+        path = self._path(key)
+        try:
+            with open(path) as entry_file:
+                entry = json.load(entry_file)
+        except (OSError, ValueError):
+            return None
+
+        expires = entry.get("expires")
+        if expires is not None and expires < time.time():
+            return None
+
+        os.utime(path)
+        return entry.get("document")
+
+    def put(self, key: str, document, ttl: float):
+        """Stores a document under a key for ttl seconds, evicting older
+        entries if the cache has grown too large.
+        """
+        self.put_text(key, json.dumps(document), ttl)
+
+    def put_text(self, key: str, text: str, ttl: float):
+        """Stores a document that is already encoded as JSON text, as
+        put does.
+        """
+        path = self._path(key)
+        expires = None if ttl == FOREVER else time.time() + ttl
+        data = '{{"key": {}, "expires": {}, "document": {}}}'.format(
+            json.dumps(key), json.dumps(expires), text
+        )
+
+        try:
+            self.size -= os.path.getsize(path)
+        except OSError:
+            pass
+
+        partial_path = path + ".part"
+        with open(partial_path, "w") as entry_file:
+            entry_file.write(data)
+        os.replace(partial_path, path)
+        self.size += os.path.getsize(path)
+
+        if self.size > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """Removes the least recently used entries until the cache is
+        back under its size limit.
+        """
+        entries = sorted((entry for entry in os.scandir(self.root)
+                          if entry.name.endswith(".json")),
+                         key=lambda entry: entry.stat().st_mtime)
+        for entry in entries:
+            if self.size <= self.max_bytes:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+                self.size -= size
+            except OSError:
+                pass
@@ -23,7 +23,8 @@ import argparse
 import sys
 import textwrap
 
-from chandere import __doc__, __version__, output
+from chandere import __doc__, __version__, cache, client, output, retry
+from chandere.actions._common import DEFAULT_TARGET_JOBS
 from chandere.loader import list_actions, list_scrapers
 from chandere.loader import load_action, load_scraper
 
@@ -255,7 +256,7 @@ SCRAPER_OPTIONS = PARSER.add_argument_group("Scraping Options")
 SCRAPER_OPTIONS.add_argument(
     "targets",
     metavar="TARGETS",
-    nargs="+",
+    nargs="*",
     help=wrap(
         "The targets to download from."
     )
@@ -293,6 +294,139 @@ SCRAPER_OPTIONS.add_argument(
         "Path to a python script exposing the scraping API to be used."
     )
 )
+SCRAPER_OPTIONS.add_argument(
+    "--replay",
+    metavar="PATH",
+    help=wrap(
+        "Path to a file written with --dead-letters. Instead of scraping "
+        "TARGETS, only the threads and files that previously failed are "
+        "collected again."
+    )
+)
+SCRAPER_OPTIONS.add_argument(
+    "--target-jobs",
+    metavar="N",
+    type=int,
+    default=DEFAULT_TARGET_JOBS,
+    help=wrap(
+        "The number of targets to collect at the same time. Results from "
+        "each are taken in turn, so that a large board doesn't hold up "
+        "smaller ones. Downloads named with {{index}} collect one target at a "
+        "time, so that the numbering is the same on every run. Defaults to "
+        "{}.".format(DEFAULT_TARGET_JOBS)
+    )
+)
+SCRAPER_OPTIONS.add_argument(
+    "--workers",
+    metavar="N",
+    type=int,
+    default=1,
+    help=wrap(
+        "The number of processes to divide the targets between, each "
+        "collecting and writing its share on a core of its own. Outputs are "
+        "merged once every process has finished. Defaults to 1."
+    )
+)
+SCRAPER_OPTIONS.add_argument(
+    "--raw-fields",
+    action="store_true",
+    help=wrap(
+        "Keep every field that the website's API provides for a post, rather "
+        "than only the common ones, so that they can be used in output "
+        "templates and --data-format."
+    )
+)
+
+
+NETWORK_OPTIONS = PARSER.add_argument_group("Network Options")
+NETWORK_OPTIONS.add_argument(
+    "--connections-per-host",
+    metavar="N",
+    type=int,
+    default=client.DEFAULT_CONNECTIONS_PER_HOST,
+    help=wrap(
+        "The maximum number of simultaneous connections to a single host. "
+        "Defaults to {}.".format(client.DEFAULT_CONNECTIONS_PER_HOST)
+    )
+)
+NETWORK_OPTIONS.add_argument(
+    "--timeout",
+    metavar="SECONDS",
+    type=float,
+    default=client.DEFAULT_TIMEOUT,
+    help=wrap(
+        "How long to wait when connecting to a host or waiting for data "
+        "before giving up. Defaults to {}.".format(client.DEFAULT_TIMEOUT)
+    )
+)
+NETWORK_OPTIONS.add_argument(
+    "--retries",
+    metavar="N",
+    type=int,
+    default=retry.DEFAULT_RETRIES,
+    help=wrap(
+        "How many times to retry a request that fails for a reason that "
+        "is likely to be temporary. Defaults to {}.".format(
+            retry.DEFAULT_RETRIES
+        )
+    )
+)
+NETWORK_OPTIONS.add_argument(
+    "--dead-letters",
+    metavar="PATH",
+    help=wrap(
+        "A file to which requests that fail even after being retried are "
+        "appended, so that they can be retried later with --replay."
+    )
+)
+NETWORK_OPTIONS.add_argument(
+    "--rate",
+    metavar="N",
+    type=float,
+    help=wrap(
+        "The maximum number of requests per second to send to a single "
+        "host. Overrides the limits that website modules set by default."
+    )
+)
+NETWORK_OPTIONS.add_argument(
+    "--burst",
+    metavar="N",
+    type=int,
+    default=1,
+    help=wrap(
+        "The number of requests that can be sent to a host at once before "
+        "--rate applies. Defaults to 1."
+    )
+)
+NETWORK_OPTIONS.add_argument(
+    "--cache-dir",
+    metavar="DIR",
+    help=wrap(
+        "A directory in which to cache API responses. Catalogs and threads "
+        "are reused for a short while, and archived threads indefinitely."
+    )
+)
+NETWORK_OPTIONS.add_argument(
+    "--cache-size",
+    metavar="MB",
+    type=int,
+    default=cache.DEFAULT_MAX_BYTES // (1024 * 1024),
+    help=wrap(
+        "The size the cache may grow to before the least recently used "
+        "responses are evicted. Defaults to {}.".format(
+            cache.DEFAULT_MAX_BYTES // (1024 * 1024)
+        )
+    )
+)
+NETWORK_OPTIONS.add_argument(
+    "--validator-cache",
+    metavar="PATH",
+    help=wrap(
+        "A file in which to remember when each catalog and thread was last "
+        "modified. Catalogs and threads that have not changed since the "
+        "previous run are skipped without being downloaded."
+    )
+)
 
 
 OUTPUT_OPTIONS = PARSER.add_argument_group("Output Options")
@@ -0,0 +1,386 @@
+# Copyright (C) 2017 Jakob Kreuze, All Rights Reserved.
+#
+# This file is part of Chandere.
+#
+# Chandere is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Chandere is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Chandere. If not, see <http://www.gnu.org/licenses/>.
+
+"""Process-wide HTTP client shared by scrapers and actions. A single
+connection pool is opened by the entry point and every request made
+through this module reuses it, so that keep-alive connections and
+resolved addresses survive from one request to the next.
+"""
+
+from urllib.parse import urlencode, urlsplit
+import asyncio
+import json
+
+import aiohttp
+
+from chandere import jsonstream, output
+from chandere.errors import ChandereError, HTTPError, check_http_status
+from chandere.ratelimit import THROTTLE_STATUSES, RateLimiter, backoff
+from chandere.ratelimit import parse_retry_after
+from chandere.retry import DEFAULT_RETRIES, DeadLetters, is_retryable
+from chandere.retry import retry
+
+DEFAULT_CONNECTIONS_PER_HOST = 8
+DEFAULT_DNS_CACHE_TTL = 300
+DEFAULT_KEEPALIVE_TIMEOUT = 30
+DEFAULT_TIMEOUT = 60
+
+# How many times a throttled request is retried before the throttling
+# status is passed on to the caller.
+DEFAULT_THROTTLE_RETRIES = 5
+
+_current = None
+
+
+def _cache_key(uri: str, params=None) -> str:
+    """Returns a string identifying a request for caching purposes."""
+    if not params:
+        return uri
+    return uri + "?" + urlencode(sorted(params.items()))
+
+
+class ValidatorCache:
+    """Remembers the Last-Modified and ETag validators that servers sent
+    for each URI, so that later requests for it can be made conditional.
+    If a path is given, validators are loaded from and saved to it.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.validators = {}
+
+        if path is not None:
+            try:
+                with open(path) as cache_file:
+                    self.validators = json.load(cache_file)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                error = "Could not read validator cache '{}': {}"
+                raise ChandereError(error.format(path, e))
+
+    def headers(self, key: str) -> dict:
+        """Returns the conditional request headers for a key."""
+        validators = self.validators.get(key, {})
+        headers = {}
+        if "Last-Modified" in validators:
+            headers["If-Modified-Since"] = validators["Last-Modified"]
+        if "ETag" in validators:
+            headers["If-None-Match"] = validators["ETag"]
+        return headers
+
+    def update(self, key: str, headers):
+        """Stores the validators from a response's headers."""
+        validators = {name: headers[name]
+                      for name in ("Last-Modified", "ETag")
+                      if name in headers}
+        if validators:
+            self.validators[key] = validators
+
+    def save(self):
+        """Writes the validators back to disk, if a path was given."""
+        if self.path is not None:
+            with open(self.path, "w") as cache_file:
+                json.dump(self.validators, cache_file)
+
+
+class _Request:
+    """Asynchronous context manager for a request made through a Client,
+    mirroring the one returned by aiohttp.
+    """
+    def __init__(self, client, method: str, uri: str, kwargs: dict):
+        self.client = client
+        self.method = method
+        self.uri = uri
+        self.kwargs = kwargs
+        self.response = None
+
+    async def __aenter__(self):
+        self.response = await self.client.request(self.method, self.uri,
+                                                  **self.kwargs)
+        return self.response
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.response.release()
+
+
+class Client:
+    """A connection-pooled HTTP client. Entering the client as an
+    asynchronous context manager opens its session and installs it as
+    the client used by the module-level request functions.
+    """
+    def __init__(self, connections_per_host=DEFAULT_CONNECTIONS_PER_HOST,
+                 timeout=DEFAULT_TIMEOUT, dns_cache_ttl=DEFAULT_DNS_CACHE_TTL,
+                 keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT,
+                 validators=None, rate_limiter=None,
+                 throttle_retries=DEFAULT_THROTTLE_RETRIES,
+                 retries=DEFAULT_RETRIES, dead_letters_path=None,
+                 cache=None):
+        self.connections_per_host = connections_per_host
+        self.timeout = timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.validators = validators or ValidatorCache()
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.throttle_retries = throttle_retries
+        self.retries = retries
+        self.dead_letters = DeadLetters()
+        self.dead_letters_path = dead_letters_path
+        self.cache = cache
+        self.session = None
+
+    async def __aenter__(self):
+        global _current
+
+        connector = aiohttp.TCPConnector(
+            limit_per_host=self.connections_per_host,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout
+        )
+
+        # The timeout applies to connecting and to each read rather than
+        # to the request as a whole, as large files can legitimately take
+        # a long time to download.
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            connect=self.timeout,
+            sock_read=self.timeout
+        )
+
+        self.session = aiohttp.ClientSession(connector=connector,
+                                             timeout=timeout)
+        _current = self
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        global _current
+
+        if _current is self:
+            _current = None
+        await self.session.close()
+        self.session = None
+
+        # Validators from an interrupted run may belong to documents that
+        # were never fully processed, so only a clean exit keeps them.
+        if exc_type is None:
+            self.validators.save()
+
+        if self.dead_letters.entries:
+            count = len(self.dead_letters.entries)
+            if self.dead_letters_path is not None:
+                self.dead_letters.save(self.dead_letters_path)
+                output.warning("{} requests failed and were recorded in "
+                               "'{}'.".format(count, self.dead_letters_path))
+            else:
+                output.warning("{} requests failed.".format(count))
+
+    async def request(self, method: str, uri: str, **kwargs):
+        """Issues a request once the host's rate limit allows it,
+        returning the response. Throttled requests are retried after the
+        delay the server asks for, or after an exponential backoff if it
+        doesn't say.
+        """
+        bucket = self.rate_limiter.bucket(urlsplit(uri).hostname)
+        attempt = 0
+
+        while True:
+            await bucket.acquire()
+            response = await self.session.request(method, uri, **kwargs)
+
+            if response.status not in THROTTLE_STATUSES:
+                bucket.succeeded()
+                return response
+            if attempt >= self.throttle_retries:
+                return response
+
+            delay = parse_retry_after(response.headers.get("Retry-After"))
+            if delay is None:
+                delay = backoff(attempt)
+            response.release()
+            bucket.throttled(delay)
+            attempt += 1
+
+    def get(self, uri: str, **kwargs):
+        """Issues a GET request, returning a context manager for the
+        response like aiohttp's.
+        """
+        return _Request(self, "GET", uri, kwargs)
+
+    async def _get_json(self, uri: str, params, conditional: bool, ttl):
+        key = _cache_key(uri, params)
+        headers = self.validators.headers(key) if conditional else {}
+
+        async with self.get(uri, params=params, headers=headers) as response:
+            check_http_status(response.status, uri)
+            if response.status == 304:
+                return None
+            document = await response.json(content_type=None)
+            self.validators.update(key, response.headers)
+
+        if self.cache is not None and ttl is not None:
+            if callable(ttl):
+                ttl = ttl(document)
+            self.cache.put(key, document, ttl)
+        return document
+
+    async def get_json(self, uri: str, params=None, conditional=False,
+                       ttl=None):
+        """Fetches and decodes the JSON document at the given URI,
+        retrying transient failures and raising an HTTPError if it can't
+        be fetched.
+
+        If conditional is set, the request carries the validators from
+        the last time the document was fetched, and None is returned if
+        the server reports that it has not been modified since.
+
+        If ttl is given and the client has a response cache, the
+        document is served from the cache while it is fresh, and stored
+        in it for ttl seconds otherwise. ttl may also be a function that
+        takes the document and returns the number of seconds.
+        """
+        if self.cache is not None and ttl is not None:
+            document = self.cache.get(_cache_key(uri, params))
+            if document is not None:
+                return document
+
+        try:
+            return await retry(
+                lambda: self._get_json(uri, params, conditional, ttl),
+                self.retries,
+                "'{}'".format(uri)
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            error = "Could not fetch '{}': {}"
+            raise HTTPError(error.format(uri, str(e) or type(e).__name__),
+                            uri)
+
+    async def _open(self, uri: str, params, headers: dict):
+        response = await self.request("GET", uri, params=params,
+                                      headers=headers)
+        try:
+            check_http_status(response.status, uri)
+        except HTTPError:
+            response.release()
+            raise
+        return response
+
+    async def stream_json(self, uri: str, path: tuple, params=None,
+                          conditional=False, ttl=None):
+        """Fetches the JSON document at the given URI like get_json,
+        but yields the values at path in it (see chandere.jsonstream)
+        as soon as each has been received, rather than decoding the
+        document as a whole.
+
+        A response that is cut short is fetched again, skipping the
+        values that were already yielded. If ttl is a function, it is
+        given the first value rather than the document.
+        """
+        key = _cache_key(uri, params)
+        caching = self.cache is not None and ttl is not None
+        if caching:
+            document = self.cache.get(key)
+            if document is not None:
+                for item in jsonstream.select(document, path):
+                    yield item
+                return
+
+        headers = self.validators.headers(key) if conditional else {}
+        description = "'{}'".format(uri)
+        yielded = 0
+        first = None
+        attempt = 0
+
+        while True:
+            try:
+                response = await retry(
+                    lambda: self._open(uri, params, headers),
+                    self.retries,
+                    description
+                )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = "Could not fetch '{}': {}"
+                raise HTTPError(error.format(uri, str(e) or type(e).__name__),
+                                uri)
+
+            raw = [] if caching else None
+            skip = yielded
+            try:
+                if response.status == 304:
+                    return
+                async for item in jsonstream.items(response.content.iter_any(),
+                                                   path, raw):
+                    if skip:
+                        skip -= 1
+                        continue
+                    if yielded == 0:
+                        first = item
+                    yielded += 1
+                    yield item
+                self.validators.update(key, response.headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError,
+                    ValueError) as e:
+                if attempt >= self.retries or not is_retryable(e):
+                    error = "Could not fetch '{}': {}"
+                    raise HTTPError(error.format(uri, str(e)
+                                                 or type(e).__name__), uri)
+                delay = backoff(attempt)
+                output.info("Retrying {} in {:.1f}s after error: {}".format(
+                    description, delay, str(e) or type(e).__name__
+                ))
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            finally:
+                response.release()
+
+            if caching:
+                if callable(ttl):
+                    ttl = ttl(first)
+                text = b"".join(raw).decode("utf-8")
+                self.cache.put_text(key, text, ttl)
+            return
+
+
+def current() -> Client:
+    """Returns the client opened by the entry point, raising a
+    ChandereError if no client is open.
+    """
+    if _current is None:
+        raise ChandereError("No HTTP client has been opened.")
+    return _current
+
+
+def get(uri: str, **kwargs):
+    """Issues a GET request through the current client."""
+    return current().get(uri, **kwargs)
+
+
+async def get_json(uri: str, params=None, conditional=False, ttl=None):
+    """Fetches a JSON document through the current client."""
+    return await current().get_json(uri, params, conditional, ttl)
+
+
+def stream_json(uri: str, path: tuple, params=None, conditional=False,
+                ttl=None):
+    """Streams the values at path in a JSON document through the
+    current client.
+    """
+    return current().stream_json(uri, path, params, conditional, ttl)
+
+
+def dead_letters() -> DeadLetters:
+    """Returns the dead-letter list of the current client."""
+    return current().dead_letters
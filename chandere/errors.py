@@ -27,12 +27,24 @@ class ChandereError(Exception):
         Exception.__init__(self, *args, **kwargs)
 
 
+class HTTPError(ChandereError):
+    """Signals that a request failed, either because the server responded
+    with an error status or because it could not be reached at all, in
+    which case status is None.
+    """
+    def __init__(self, message: str, url=None, status=None):
+        ChandereError.__init__(self, message)
+        self.url = url
+        self.status = status
+
+
 def check_http_status(code: int, url=None):
-    """Checks an HTTP status code, throwing a ChandereError if the code
-    signifies an error status.
+    """Checks an HTTP status code, throwing an HTTPError if the code
+    signifies an error status. A 304 is not considered an error, as it
+    only means that a conditional request found nothing new.
     """
-    if code != 200:
+    if code not in (200, 304):
         error = "Encountered HTTP/1.1 {}".format(code)
         if url is not None:
             error += " while fetching '{}'.".format(url)
-        raise ChandereError(error)
+        raise HTTPError(error, url, code)
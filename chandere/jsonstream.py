@@ -0,0 +1,205 @@
+# Copyright (C) 2017 Jakob Kreuze, All Rights Reserved.
+#
+# This file is part of Chandere.
+#
+# Chandere is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Chandere is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Chandere. If not, see <http://www.gnu.org/licenses/>.
+
+"""Incremental decoding of JSON documents as they are received. Rather
+than waiting for a whole catalog or thread, the items of an array deep
+inside it are decoded and handed over one at a time, as soon as each has
+arrived in full.
+
+Which items are wanted is described by a path, a tuple in which a string
+steps into the member of an object with that name and ITEMS steps into
+each element of an array. The posts of a thread are at ("posts", ITEMS),
+and the threads of a catalog at (ITEMS, "threads", ITEMS). Parts of the
+document that the path doesn't lead through are skipped.
+"""
+
+import codecs
+import json
+import re
+
+# Steps into each element of an array.
+ITEMS = None
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class _Reader:
+    """Buffers the text decoded from an asynchronous iterable of byte
+    chunks, discarding what has been consumed as it goes.
+    """
+    def __init__(self, chunks):
+        self.chunks = chunks.__aiter__()
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.received = None
+
+    async def fill(self) -> bool:
+        """Appends the next chunk to the buffer, returning False if
+        there are no more.
+        """
+        if self.eof:
+            return False
+        try:
+            chunk = await self.chunks.__anext__()
+        except StopAsyncIteration:
+            self.eof = True
+            chunk = b""
+        if self.received is not None:
+            self.received.append(chunk)
+        self.buffer = self.buffer[self.pos:] + self.decoder.decode(
+            chunk, final=self.eof
+        )
+        self.pos = 0
+        return True
+
+    async def peek(self) -> str:
+        """Skips whitespace and returns the next character without
+        consuming it.
+        """
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not await self.fill():
+                raise _error("Unexpected end of document", self)
+
+    async def next(self) -> str:
+        """Consumes and returns the next character after whitespace."""
+        character = await self.peek()
+        self.pos += 1
+        return character
+
+    async def expect(self, character: str):
+        if await self.next() != character:
+            raise _error("Expecting '{}'".format(character), self)
+
+    async def value(self):
+        """Decodes and consumes the next complete value."""
+        await self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # Waiting for the buffer to double before trying again
+                # keeps large values from being decoded over and over.
+                wanted = 2 * (len(self.buffer) - self.pos)
+                if not await self.fill():
+                    raise
+                while len(self.buffer) < wanted and await self.fill():
+                    pass
+                continue
+
+            # A number at the end of the buffer may have more digits to
+            # come.
+            if end < len(self.buffer) or not await self.fill():
+                self.pos = end
+                return value
+
+
+def _error(message: str, reader: _Reader):
+    return json.JSONDecodeError(message, reader.buffer, reader.pos)
+
+
+async def _walk(reader: _Reader, path: tuple):
+    if not path:
+        yield await reader.value()
+        return
+
+    step, rest = path[0], path[1:]
+    opening = await reader.peek()
+
+    if step is ITEMS:
+        if opening != "[":
+            await reader.value()
+            return
+        reader.pos += 1
+        if await reader.peek() == "]":
+            reader.pos += 1
+            return
+        while True:
+            async for item in _walk(reader, rest):
+                yield item
+            delimiter = await reader.next()
+            if delimiter == "]":
+                return
+            if delimiter != ",":
+                raise _error("Expecting ',' or ']'", reader)
+
+    if opening != "{":
+        await reader.value()
+        return
+    reader.pos += 1
+    if await reader.peek() == "}":
+        reader.pos += 1
+        return
+    while True:
+        key = await reader.value()
+        await reader.expect(":")
+        if key == step:
+            async for item in _walk(reader, rest):
+                yield item
+        else:
+            await reader.value()
+        delimiter = await reader.next()
+        if delimiter == "}":
+            return
+        if delimiter != ",":
+            raise _error("Expecting ',' or '}'", reader)
+
+
+async def items(chunks, path: tuple, raw=None):
+    """Yields the values found at path in the JSON document read from
+    chunks, an asynchronous iterable of bytes, as soon as each has been
+    received. A JSONDecodeError is raised if the document is malformed
+    or cut short.
+
+    If a list is given as raw, the chunks that make up the document are
+    appended to it.
+    """
+    reader = _Reader(chunks)
+    if raw is not None:
+        reader.received = raw
+
+    async for item in _walk(reader, path):
+        yield item
+
+    # Anything but whitespace after the document means it's malformed.
+    reader.pos = _WHITESPACE.match(reader.buffer, reader.pos).end()
+    while reader.pos == len(reader.buffer) and await reader.fill():
+        reader.pos = _WHITESPACE.match(reader.buffer, reader.pos).end()
+    if reader.pos < len(reader.buffer):
+        raise _error("Extra data", reader)
+
+
+def select(document, path: tuple):
+    """Yields the values found at path in an already decoded document,
+    in the same way as items.
+    """
+    if not path:
+        yield document
+        return
+
+    step, rest = path[0], path[1:]
+    if step is ITEMS:
+        if isinstance(document, list):
+            for element in document:
+                yield from select(element, rest)
+    elif isinstance(document, dict) and step in document:
+        yield from select(document[step], rest)
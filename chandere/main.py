@@ -20,35 +20,180 @@
 import asyncio
 import sys
 
-from chandere import output
+from chandere import client, output, search, workers
+from chandere.actions import _common as action_common
+from chandere.cache import ResponseCache
 from chandere.cli import PARSER, reorder_args
 from chandere.errors import ChandereError
 from chandere.loader import load_action, load_custom_action
 from chandere.loader import load_custom_scraper, load_scraper
+from chandere.ratelimit import RateLimiter
+from chandere.retry import DeadLetters, Replay
+from chandere.websites import _common as website_common
+
+
+def _prepare(args, argv: list) -> tuple:
+    """Loads the action and scraper, and parses the targets."""
+    if args.custom_action is not None:
+        action = load_custom_action(args.custom_action)
+    else:
+        action = load_action(args.action)
+
+    if args.custom_scraper is not None:
+        scraper = load_custom_scraper(args.custom_scraper)
+    else:
+        scraper = load_scraper(args.website)
+
+    if not hasattr(scraper, "parse_target"):
+        raise ChandereError("Scraper module lacks a target parser.")
+
+    # Actions that can store nested fields ask for the raw ones.
+    website_common.keep_raw = args.raw_fields or \
+        getattr(action, "RAW_FIELDS", False)
+
+    # Scrapers that sync boards also set this when they are configured.
+    website_common.incremental = args.validator_cache is not None
+
+    if args.target_jobs < 1:
+        raise ChandereError("The number of target jobs must be at least 1.")
+    action_common.target_jobs = args.target_jobs
+
+    if args.workers < 1:
+        raise ChandereError("The number of workers must be at least 1.")
+
+    if hasattr(scraper, "configure"):
+        scraper.configure(argv)
+
+    if args.replay is not None:
+        scraper = Replay(scraper, DeadLetters.load(args.replay))
+        targets = scraper.targets()
+    elif args.targets:
+        targets = [scraper.parse_target(target) for target in args.targets]
+    else:
+        raise ChandereError("No targets were specified.")
+
+    return action, scraper, targets
+
+
+async def _invoke(action, scraper, targets: list, args, argv: list,
+                  shares=1):
+    """Opens the shared HTTP client and hands off to the action. shares
+    is the number of processes that are running at once.
+    """
+    validators = client.ValidatorCache(args.validator_cache)
+    if args.validator_cache is not None:
+        validators.path = action_common.shard_path(args.validator_cache)
+
+    dead_letters_path = None
+    if args.dead_letters is not None:
+        dead_letters_path = action_common.shard_path(args.dead_letters)
+
+    # Website modules can declare a budget for each of their hosts, which
+    # an explicit --rate overrides everywhere.
+    if args.rate is not None:
+        rate_limiter = RateLimiter(default=(args.rate, args.burst),
+                                   shares=shares)
+    else:
+        rate_limiter = RateLimiter(getattr(scraper, "RATE_LIMITS", {}),
+                                   shares=shares)
+
+    cache = None
+    if args.cache_dir is not None:
+        cache = ResponseCache(args.cache_dir, args.cache_size * 1024 * 1024)
+
+    async with client.Client(connections_per_host=args.connections_per_host,
+                             timeout=args.timeout, validators=validators,
+                             rate_limiter=rate_limiter, retries=args.retries,
+                             dead_letters_path=dead_letters_path,
+                             cache=cache):
+        await action.invoke(scraper, targets, argv)
+
+
+def _run(loop, coroutine):
+    """Runs a coroutine on the loop until it completes. If the run is
+    interrupted, the coroutine is cancelled and run until it has wound
+    down before the KeyboardInterrupt is raised again, so that actions
+    and the client still get to write out what they have.
+    """
+    task = loop.create_task(coroutine)
+    try:
+        return loop.run_until_complete(task)
+    except KeyboardInterrupt:
+        if not task.done():
+            task.cancel()
+            try:
+                loop.run_until_complete(task)
+            except asyncio.CancelledError:
+                pass
+        raise
+
+
+def _check_skipped():
+    """Raises a ChandereError if any target was skipped after failing."""
+    if action_common.skipped_targets:
+        raise ChandereError("{} target(s) could not be collected.".format(
+            action_common.skipped_targets
+        ))
+
+
+def _work(argv: list, index: int, count: int) -> tuple:
+    """Entry point of a worker process started with --workers, which
+    collects the index-th of count shares of the targets. Returns the
+    outputs the worker wrote copies of, and the error that stopped it,
+    if any.
+    """
+    args, unparsed = PARSER.parse_known_args(argv)
+    action_common.shard_index = index
+    action_common.shard_count = count
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    try:
+        action, scraper, targets = _prepare(args, unparsed)
+        _run(loop, _invoke(action, scraper,
+                           workers.shard(targets, count)[index], args,
+                           unparsed, count))
+        _check_skipped()
+    except ChandereError as e:
+        return action_common.shard_outputs, str(e)
+    finally:
+        loop.close()
+
+    return action_common.shard_outputs, None
 
 
 def main():
+    # Searching an archive doesn't scrape anything, and has its own
+    # arguments.
+    if sys.argv[1:2] == ["search"]:
+        search.main(sys.argv[2:])
+        return
+
     # There are a handful of code paths that aren't called from this
     # entry routine. See `cli.py` for routines such as --list-actions
-    args, unparsed = PARSER.parse_known_args(reorder_args(sys.argv[1:]))
+    argv = reorder_args(sys.argv[1:])
+    args, unparsed = PARSER.parse_known_args(argv)
     loop = asyncio.get_event_loop()
 
     try:
-        if args.custom_action is not None:
-            action = load_custom_action(args.custom_action)
-        else:
-            action = load_action(args.action)
+        action, scraper, targets = _prepare(args, unparsed)
 
-        if args.custom_scraper is not None:
-            scraper = load_custom_scraper(args.custom_scraper)
-        else:
-            scraper = load_scraper(args.website)
-
-        if not hasattr(scraper, "parse_target"):
-            raise ChandereError("Scraper module lacks a target parser.")
+        # There's no use in more workers than targets.
+        count = min(args.workers, len(targets))
+        if count > 1:
+            results = workers.run(_work, argv, count)
+            errors = [error for _, error in results if error is not None]
+            for error in errors:
+                output.error(error)
 
-        targets = [scraper.parse_target(target) for target in args.targets]
-        loop.run_until_complete(action.invoke(scraper, targets, unparsed))
+            # Whatever the other workers managed is kept regardless.
+            workers.merge(action, args, unparsed,
+                          [outputs for outputs, _ in results])
+            if errors:
+                sys.exit(1)
+        else:
+            _run(loop, _invoke(action, scraper, targets, args, unparsed))
+            _check_skipped()
 
     except ChandereError as e:
         output.error(str(e))
@@ -0,0 +1,133 @@
+# Copyright (C) 2017 Jakob Kreuze, All Rights Reserved.
+#
+# This file is part of Chandere.
+#
+# Chandere is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Chandere is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Chandere. If not, see <http://www.gnu.org/licenses/>.
+
+"""A persistent record of downloaded files, so that repeated runs over
+the same targets can skip anything that was already fetched without
+making a request.
+"""
+
+import os
+import sqlite3
+
+from chandere.errors import ChandereError
+
+# Changes are committed in batches of this many records, as committing
+# after every file would make the manifest the bottleneck.
+COMMIT_INTERVAL = 256
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    site TEXT NOT NULL,
+    board TEXT NOT NULL,
+    post TEXT NOT NULL,
+    file TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER,
+    complete INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (site, board, post, file)
+) WITHOUT ROWID
+"""
+
+
+def target_board(target) -> str:
+    """Returns the part of a parsed target that identifies its board,
+    which is the first element for imageboards and the whole target for
+    everything else.
+    """
+    if isinstance(target, tuple):
+        return str(target[0])
+    return str(target)
+
+
+class Manifest:
+    """An SQLite database of files, keyed by the site, board and post
+    they were found in along with the file's digest or URI. The primary
+    key doubles as the lookup index, so checking a file costs a single
+    B-tree search no matter how large the manifest grows.
+
+    If base is given, it is the path of another manifest that lookups
+    fall back to but that is never written, so that worker processes can
+    each record files in a manifest of their own.
+    """
+    def __init__(self, path: str, base=None):
+        self.base = None
+        try:
+            self.connection = sqlite3.connect(path)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(SCHEMA)
+            if base is not None and os.path.exists(base):
+                self.base = sqlite3.connect(base)
+        except sqlite3.Error as e:
+            error = "Could not open manifest '{}': {}"
+            raise ChandereError(error.format(path, e))
+        self.uncommitted = 0
+
+    def lookup(self, key: tuple):
+        """Returns the (path, size, complete) record for a key, or None
+        if the file has never been seen.
+        """
+        query = "SELECT path, size, complete FROM files WHERE site = ? AND " \
+                "board = ? AND post = ? AND file = ?"
+        row = self.connection.execute(query, key).fetchone()
+        if row is None and self.base is not None:
+            row = self.base.execute(query, key).fetchone()
+        return (row[0], row[1], bool(row[2])) if row is not None else None
+
+    def is_complete(self, key: tuple, path: str) -> bool:
+        """Returns whether or not the file for a key was completely
+        downloaded to the given path by a previous run.
+        """
+        record = self.lookup(key)
+        return record is not None and record[2] and record[0] == path
+
+    def record(self, key: tuple, path: str, size=None, complete=False):
+        """Inserts or updates the record for a key."""
+        self.connection.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+            key + (path, size, int(complete))
+        )
+        self.uncommitted += 1
+        if self.uncommitted >= COMMIT_INTERVAL:
+            self.commit()
+
+    def commit(self):
+        """Writes any batched changes to disk."""
+        self.connection.commit()
+        self.uncommitted = 0
+
+    def merge(self, path: str):
+        """Copies every record from the manifest at path, replacing any
+        records for the same files.
+        """
+        self.commit()
+        try:
+            self.connection.execute("ATTACH DATABASE ? AS other", (path,))
+            with self.connection:
+                self.connection.execute("INSERT OR REPLACE INTO files "
+                                        "SELECT * FROM other.files")
+            self.connection.execute("DETACH DATABASE other")
+        except sqlite3.Error as e:
+            error = "Could not merge manifest '{}': {}"
+            raise ChandereError(error.format(path, e))
+
+    def close(self):
+        """Commits outstanding changes and closes the database."""
+        self.commit()
+        self.connection.close()
+        if self.base is not None:
+            self.base.close()
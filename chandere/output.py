@@ -58,3 +58,11 @@ def error(msg="", end="\n"):
     """
     sys.stdout.write(_ansi_wrap("38;5;9", "Critical Error: "))
     sys.stdout.write(msg + end)
+
+
+def warning(msg="", end="\n"):
+    """Displays a message to the console unconditionally, highlighted to
+    signify a problem that does not stop the program from continuing.
+    """
+    sys.stdout.write(_ansi_wrap("38;5;11", "Warning: "))
+    sys.stdout.write(msg + end)
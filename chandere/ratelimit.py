@@ -0,0 +1,136 @@
+# Copyright (C) 2017 Jakob Kreuze, All Rights Reserved.
+#
+# This file is part of Chandere.
+#
+# Chandere is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Chandere is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Chandere. If not, see <http://www.gnu.org/licenses/>.
+
+"""Per-host request scheduling. Every request waits for a token from
+the bucket belonging to its host, and hosts that respond with a
+throttling status are backed off from.
+"""
+
+from email.utils import parsedate_to_datetime
+import asyncio
+import random
+import time
+
+# Statuses with which servers signal that they are being asked too much.
+THROTTLE_STATUSES = (429, 503)
+
+BASE_BACKOFF = 1.0
+MAX_BACKOFF = 120.0
+
+# A throttled bucket halves its rate, but never drops below this
+# fraction of the rate it was configured with.
+MIN_RATE_FACTOR = 1 / 16
+
+
+def parse_retry_after(value):
+    """Parses the value of a Retry-After header, which is either a
+    number of seconds or an HTTP date, into a number of seconds from
+    now. Returns None if the value is missing or malformed.
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt: int) -> float:
+    """Returns how long to wait before the given retry attempt, growing
+    exponentially and randomized so that concurrent requests don't all
+    retry at the same moment.
+    """
+    delay = min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt)
+    return random.uniform(delay / 2, delay)
+
+
+class TokenBucket:
+    """Hands out up to burst tokens at once, refilling at rate tokens per
+    second. A rate of None places no limit on requests, though the bucket
+    can still be paused after a host throttles us.
+    """
+    def __init__(self, rate=None, burst=1):
+        self.configured_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        if self.rate is not None:
+            elapsed = now - self.updated
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Waits until a request may be made."""
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+
+            if self.rate is None:
+                return
+
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def throttled(self, delay: float):
+        """Pauses the bucket for delay seconds and halves its rate."""
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        if self.rate is not None:
+            floor = self.configured_rate * MIN_RATE_FACTOR
+            self.rate = max(floor, self.rate / 2)
+            self.tokens = 0.0
+
+    def succeeded(self):
+        """Gradually restores the rate of a bucket that was throttled."""
+        if self.rate is not None and self.rate < self.configured_rate:
+            increase = self.configured_rate * MIN_RATE_FACTOR
+            self.rate = min(self.configured_rate, self.rate + increase)
+
+
+class RateLimiter:
+    """A collection of token buckets, one per host. Hosts without an
+    entry in limits share the default (rate, burst) budget, or are not
+    limited at all if there is no default. When several processes are
+    sending requests to the same hosts, each is given an equal share of
+    every budget.
+    """
+    def __init__(self, limits=None, default=None, shares=1):
+        self.limits = limits or {}
+        self.default = default
+        self.shares = shares
+        self.buckets = {}
+
+    def bucket(self, host: str) -> TokenBucket:
+        """Returns the token bucket for a host."""
+        if host not in self.buckets:
+            rate, burst = self.limits.get(host, self.default or (None, 1))
+            if rate is not None:
+                rate /= self.shares
+            self.buckets[host] = TokenBucket(rate, burst // self.shares)
+        return self.buckets[host]
@@ -0,0 +1,185 @@
+# Copyright (C) 2017 Jakob Kreuze, All Rights Reserved.
+#
+# This file is part of Chandere.
+#
+# Chandere is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Chandere is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Chandere. If not, see <http://www.gnu.org/licenses/>.
+
+"""Retrying of requests that fail for transient reasons, and the
+dead-letter list in which requests that never succeed are recorded so
+that they can be replayed by a later run.
+"""
+
+import asyncio
+import json
+
+import aiohttp
+
+from chandere import output
+from chandere.errors import ChandereError, HTTPError
+from chandere.ratelimit import backoff
+
+DEFAULT_RETRIES = 3
+
+# Statuses that suggest the request might succeed if it is made again.
+# Throttling statuses are absent, as the client has already retried
+# those for as long as it is willing to by the time they are raised.
+RETRYABLE_STATUSES = (408, 500, 502, 504)
+
+# Stands in for the target when replaying the files in a dead-letter
+# list, which were found by scraping targets that need not be revisited.
+REPLAY_FILES = "dead letters"
+
+
+def is_retryable(error: Exception) -> bool:
+    """Returns whether or not an error is likely to be transient."""
+    if isinstance(error, HTTPError):
+        # Without a status, the server couldn't be reached or cut the
+        # response short.
+        return error.status is None or error.status in RETRYABLE_STATUSES
+    # A truncated body tends to surface as invalid JSON.
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError,
+                              json.JSONDecodeError))
+
+
+async def retry(operation, retries=DEFAULT_RETRIES, description="request"):
+    """Awaits the coroutine returned by operation, calling it again
+    after an exponential backoff each time it fails with a transient
+    error, up to the given number of retries.
+    """
+    attempt = 0
+    while True:
+        try:
+            return await operation()
+        except Exception as e:
+            if attempt >= retries or not is_retryable(e):
+                raise
+            delay = backoff(attempt)
+            output.info("Retrying {} in {:.1f}s after error: {}".format(
+                description, delay, str(e) or type(e).__name__
+            ))
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+def _serializable(post: dict) -> dict:
+    """Returns the fields of a post that can be represented in JSON."""
+    return {key: value for key, value in post.items()
+            if isinstance(value, (str, int, float, bool, type(None)))}
+
+
+class DeadLetters:
+    """Requests that failed even after being retried. Documents are
+    recorded with the target they belong to, and files with the post
+    they were attached to.
+    """
+    def __init__(self, entries=None):
+        self.entries = entries or []
+
+    def record_document(self, uri: str, target, error: Exception):
+        """Records a document, such as a thread, that couldn't be
+        fetched while collecting from a target.
+        """
+        if isinstance(target, tuple):
+            target = list(target)
+        self.entries.append({"kind": "document", "uri": uri,
+                             "target": target, "error": str(error)})
+
+    def record_file(self, uri: str, post: dict, error: Exception,
+                    key=None):
+        """Records a file that couldn't be downloaded, along with the
+        key identifying it in the manifest, if it has one.
+        """
+        self.entries.append({"kind": "file", "uri": uri,
+                             "post": _serializable(post),
+                             "key": list(key) if key is not None else None,
+                             "error": str(error)})
+
+    def save(self, path: str):
+        """Appends the entries to a file, one JSON object per line."""
+        with open(path, "a") as letters_file:
+            for entry in self.entries:
+                letters_file.write(json.dumps(entry) + "\n")
+
+    @staticmethod
+    def load(path: str):
+        """Reads a file written by save."""
+        try:
+            with open(path) as letters_file:
+                return DeadLetters([json.loads(line)
+                                    for line in letters_file if line.strip()])
+        except (OSError, ValueError) as e:
+            error = "Could not read dead letters '{}': {}"
+            raise ChandereError(error.format(path, e))
+
+
+async def _replay_files(entries: list):
+    for entry in entries:
+        yield (dict(entry["post"]), entry["uri"])
+
+
+async def _nothing():
+    return
+    yield
+
+
+class Replay:
+    """Stands in for a scraper module, collecting only what is listed in
+    a dead-letter file. Documents are collected again from the targets
+    they were recorded with, and files are yielded for the target
+    REPLAY_FILES without scraping anything.
+    """
+    def __init__(self, scraper, letters: DeadLetters):
+        self.scraper = scraper
+        self.letters = letters
+        self.file_keys = {entry["uri"]: tuple(entry["key"])
+                          for entry in letters.entries
+                          if entry["kind"] == "file" and entry.get("key")}
+
+        if hasattr(scraper, "collect_files"):
+            self.collect_files = self._collect_files
+        if hasattr(scraper, "collect_posts"):
+            self.collect_posts = self._collect_posts
+
+    def __getattr__(self, name: str):
+        return getattr(self.scraper, name)
+
+    def targets(self) -> list:
+        """Returns the targets to replay."""
+        targets = []
+        for entry in self.letters.entries:
+            if entry["kind"] != "document":
+                continue
+            target = entry["target"]
+            target = tuple(target) if isinstance(target, list) else target
+            if target not in targets:
+                targets.append(target)
+        return targets + [REPLAY_FILES]
+
+    def file_key(self, uri: str):
+        """Returns the manifest key that a replayed file was recorded
+        with, or None if it was recorded without one.
+        """
+        return self.file_keys.get(uri)
+
+    def _collect_files(self, target):
+        if target == REPLAY_FILES:
+            files = [entry for entry in self.letters.entries
+                     if entry["kind"] == "file"]
+            return _replay_files(files)
+        return self.scraper.collect_files(target)
+
+    def _collect_posts(self, target):
+        if target == REPLAY_FILES:
+            return _nothing()
+        return self.scraper.collect_posts(target)
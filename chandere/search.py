@@ -0,0 +1,206 @@
+# Copyright (C) 2017 Jakob Kreuze, All Rights Reserved.
+#
+# This file is part of Chandere.
+#
+# Chandere is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Chandere is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Chandere. If not, see <http://www.gnu.org/licenses/>.
+
+"""Full-text search over posts archived with the archive_sqlite action
+and --search-index, invoked as "chandere search".
+"""
+
+from datetime import datetime, timezone
+from urllib.parse import quote
+import argparse
+import calendar
+import json
+import sqlite3
+import sys
+
+from chandere import output
+from chandere.actions.archive_sqlite import has_search_index
+from chandere.cli import wrap
+from chandere.errors import ChandereError
+
+DEFAULT_LIMIT = 20
+
+QUERY = """
+SELECT posts.site, posts.board, posts.thread, posts.id, posts.time_posted,
+       posts.name, snippet(posts_fts, 2, '[', ']', '...', 24)
+FROM posts_fts JOIN posts ON posts.rowid = posts_fts.rowid
+WHERE posts_fts MATCH ?{filters}
+ORDER BY rank
+LIMIT ?
+"""
+
+RESULT_FIELDS = ("site", "board", "thread", "id", "time_posted", "name",
+                 "snippet")
+
+
+def _timestamp(value: str) -> int:
+    """Parses a UNIX timestamp or a date, such as "2017-12-01" or
+    "2017-12-01T12:00", in UTC.
+    """
+    if value.isdigit():
+        return int(value)
+    for time_format in ("%Y-%m-%d", "%Y-%m-%dT%H:%M", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            parsed = datetime.strptime(value, time_format)
+            return calendar.timegm(parsed.timetuple())
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError("invalid time '{}'".format(value))
+
+
+PARSER = argparse.ArgumentParser(
+    prog="chandere search",
+    description="Search posts archived with archive_sqlite --search-index."
+)
+PARSER.add_argument(
+    "query",
+    metavar="QUERY",
+    help=wrap(
+        "An SQLite FTS5 query, such as 'linux AND NOT windows' or "
+        "'\"thinkpad x220\"'. Searches post names, titles and comments."
+    )
+)
+PARSER.add_argument(
+    "-i",
+    "--input",
+    metavar="PATH",
+    default="./posts.db",
+    help=wrap(
+        "The archive to search. Defaults to './posts.db'."
+    )
+)
+PARSER.add_argument(
+    "--site",
+    metavar="NAME",
+    help=wrap(
+        "Only show posts from the given website module, e.g. '4chan'."
+    )
+)
+PARSER.add_argument(
+    "--board",
+    metavar="BOARD",
+    help=wrap(
+        "Only show posts from the given board."
+    )
+)
+PARSER.add_argument(
+    "--thread",
+    metavar="ID",
+    type=int,
+    help=wrap(
+        "Only show posts from the given thread."
+    )
+)
+PARSER.add_argument(
+    "--since",
+    metavar="TIME",
+    type=_timestamp,
+    help=wrap(
+        "Only show posts made at or after TIME, a UNIX timestamp or a UTC "
+        "date such as '2017-12-01' or '2017-12-01T12:00'."
+    )
+)
+PARSER.add_argument(
+    "--until",
+    metavar="TIME",
+    type=_timestamp,
+    help=wrap(
+        "Only show posts made before TIME."
+    )
+)
+PARSER.add_argument(
+    "-n",
+    "--limit",
+    metavar="N",
+    type=int,
+    default=DEFAULT_LIMIT,
+    help=wrap(
+        "The most posts to show, best matches first. Defaults to {}.".format(
+            DEFAULT_LIMIT
+        )
+    )
+)
+PARSER.add_argument(
+    "--json",
+    action="store_true",
+    help=wrap(
+        "Print each post as a line of JSON."
+    )
+)
+
+
+def search(connection, query: str, site=None, board=None, thread=None,
+           since=None, until=None, limit=DEFAULT_LIMIT) -> list:
+    """Returns the posts matching a full-text query, best matches first,
+    as dictionaries of RESULT_FIELDS.
+    """
+    filters = []
+    params = [query]
+    for column, operator, value in (("site", "=", site),
+                                    ("board", "=", board),
+                                    ("thread", "=", thread),
+                                    ("time_posted", ">=", since),
+                                    ("time_posted", "<", until)):
+        if value is not None:
+            filters.append(" AND posts.{} {} ?".format(column, operator))
+            params.append(value)
+    params.append(limit)
+
+    try:
+        cursor = connection.execute(QUERY.format(filters="".join(filters)),
+                                    params)
+        return [dict(zip(RESULT_FIELDS, row)) for row in cursor]
+    except sqlite3.OperationalError as e:
+        raise ChandereError("Invalid search query '{}': {}".format(query, e))
+
+
+def _format_result(result: dict) -> str:
+    posted = ""
+    if isinstance(result["time_posted"], int):
+        posted = datetime.fromtimestamp(result["time_posted"], timezone.utc)
+        posted = posted.strftime("%Y-%m-%d %H:%M")
+    text = " ".join((result["snippet"] or "").split())
+    line = "{site} /{board}/{thread} #{id}  {posted}  {name}\n    {text}"
+    return line.format(posted=posted, text=text, **result)
+
+
+def main(argv: list):
+    args = PARSER.parse_args(argv)
+
+    try:
+        try:
+            uri = "file:{}?mode=ro".format(quote(args.input))
+            connection = sqlite3.connect(uri, uri=True)
+            if not has_search_index(connection):
+                error = ("'{}' has no search index. Create one by archiving "
+                         "to it with archive_sqlite --search-index.")
+                raise ChandereError(error.format(args.input))
+        except sqlite3.Error as e:
+            error = "Could not open archive '{}': {}"
+            raise ChandereError(error.format(args.input, e))
+
+        results = search(connection, args.query, args.site, args.board,
+                         args.thread, args.since, args.until, args.limit)
+        for result in results:
+            if args.json:
+                output.put(json.dumps(result))
+            else:
+                output.put(_format_result(result))
+
+    except ChandereError as e:
+        output.error(str(e))
+        sys.exit(1)
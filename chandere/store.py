@@ -0,0 +1,91 @@
+# Copyright (C) 2017 Jakob Kreuze, All Rights Reserved.
+#
+# This file is part of Chandere.
+#
+# Chandere is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Chandere is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Chandere. If not, see <http://www.gnu.org/licenses/>.
+
+"""A content-addressed store for downloaded files. Each file is kept
+once, under the hex digest of its contents, and every path it should
+appear at is made a link to that copy.
+"""
+
+import os
+import shutil
+
+from chandere.errors import ChandereError
+
+LINK_MODES = ["hardlink", "symlink", "reflink"]
+
+# From <linux/fs.h>; clones the extents of one file into another on
+# filesystems that support it, such as Btrfs and XFS.
+FICLONE = 0x40049409
+
+
+def _reflink(src: str, dst: str):
+    """Makes dst a copy-on-write clone of src, falling back to a plain
+    copy where the filesystem can't share extents.
+    """
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        try:
+            # Only available on POSIX platforms.
+            import fcntl
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        except (ImportError, OSError):
+            shutil.copyfileobj(src_file, dst_file)
+
+
+class BlobStore:
+    """A directory of files named by the digest of their contents."""
+    def __init__(self, root: str, link_mode="hardlink"):
+        if link_mode not in LINK_MODES:
+            raise ChandereError("Unknown link mode '{}'.".format(link_mode))
+        self.root = root
+        self.link_mode = link_mode
+
+    def blob_path(self, digest: str) -> str:
+        """Returns the path at which the blob for a digest is stored,
+        creating its parent directory if necessary. Blobs are fanned out
+        by the first two characters of their digest, so that no single
+        directory grows too large.
+        """
+        digest = digest.lower()
+        parent = os.path.join(self.root, digest[:2])
+        os.makedirs(parent, exist_ok=True)
+        return os.path.join(parent, digest)
+
+    def contains(self, digest: str) -> bool:
+        """Returns whether or not a blob is already stored."""
+        return os.path.exists(self.blob_path(digest))
+
+    def link(self, digest: str, out_path: str):
+        """Makes out_path refer to the stored blob for a digest,
+        replacing anything that was there before.
+        """
+        blob = self.blob_path(digest)
+
+        if os.path.lexists(out_path):
+            if os.path.exists(out_path) and os.path.samefile(blob, out_path):
+                return
+            os.remove(out_path)
+
+        try:
+            if self.link_mode == "hardlink":
+                os.link(blob, out_path)
+            elif self.link_mode == "symlink":
+                os.symlink(os.path.abspath(blob), out_path)
+            else:
+                _reflink(blob, out_path)
+        except OSError as e:
+            error = "Could not link '{}' to '{}': {}"
+            raise ChandereError(error.format(out_path, blob, e.strerror))
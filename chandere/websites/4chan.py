@@ -23,18 +23,39 @@ __version__ = "0.3.0"
 
 from urllib.parse import quote
 import html
-
-import aiohttp
-
-from chandere.errors import ChandereError, check_http_status
-from chandere.websites._common import contains_uri_scheme, parse_crosslink
+import os
+
+from chandere import client
+from chandere.cache import FOREVER
+from chandere.errors import ChandereError
+from chandere.jsonstream import ITEMS
+from chandere.websites._common import Post, base64_to_hex
+from chandere.websites._common import board_parser, contains_uri_scheme
+from chandere.websites._common import Lazy, fan_out
+from chandere.websites._common import parse_crosslink, skip_failed_thread
+from chandere.websites._common import sync_board
 from chandere.websites._common import parse_imageboard_uri_factory
+from chandere.websites import _common
 
 FIELD_NAMES = ["id", "time_posted", "name", "title", "comment", "filename"]
 
 API_BASE = "https://a.4cdn.org"
 RES_BASE = "https://i.4cdn.org"
 
+# How long, in seconds, responses may be served from the response cache.
+CATALOG_TTL = 60
+THREAD_TTL = 60
+
+# Where the threads of a catalog and the posts of a thread are found.
+CATALOG_THREADS = (ITEMS, "threads", ITEMS)
+THREAD_POSTS = ("posts", ITEMS)
+
+# 4chan asks that its API not be sent more than one request a second.
+RATE_LIMITS = {"a.4cdn.org": (1.0, 1)}
+
+PARSER = board_parser()
+_options, _ = PARSER.parse_known_args([])
+
 parse_uri = parse_imageboard_uri_factory("org", "thread")
 
 
@@ -42,6 +63,10 @@ def _catalog_url(board: str) -> str:
     return API_BASE + "/{}/catalog.json".format(quote(board))
 
 
+def _threads_index_url(board: str) -> str:
+    return API_BASE + "/{}/threads.json".format(quote(board))
+
+
 def _thread_url(board: str, thread: str) -> str:
     return API_BASE + "/{}/thread/{}.json".format(board, thread)
 
@@ -50,51 +75,70 @@ def _file_url(board: str, tim: str, ext: str) -> str:
     return RES_BASE + "/{}/{}.{}".format(board, tim, ext)
 
 
-def _tidy_post_fields(post: dict):
-    post["id"] = post.get("no")
-    post["time_posted"] = post.get("time")
-    post["title"] = post.get("sub")
-    post["comment"] = html.unescape(post.get("com", ""))
-    if "ext" in post and post["ext"][0] == ".":
-        post["ext"] = post["ext"][1:]
+def _comment(comment: str):
+    # Comments without entities have nothing to unescape.
+    return Lazy(html.unescape, comment) if "&" in comment else comment
 
-    # del post["no"]
-    # del post["time"]
-    # del post["sub"]
-    # del post["com"]
 
+def _make_post(raw: dict) -> Post:
+    post = Post(raw, id=raw.get("no"),
+                thread=raw.get("resto") or raw.get("no"),
+                time_posted=raw.get("time"), name=raw.get("name"),
+                title=raw.get("sub"), comment=_comment(raw.get("com", "")))
+    if "tim" in raw:
+        post.tim = raw["tim"]
+        post.filename = raw.get("filename")
+        post.ext = raw.get("ext", "").lstrip(".")
+        post.fsize = raw.get("fsize")
+        post.md5 = Lazy(base64_to_hex, raw.get("md5"))
+    return post
 
-def _threads_from_page(page: dict) -> list:
-    return [int(thread.get("no")) for thread in page.get("threads")]
+
+def _thread_ttl(op: dict):
+    # Archived threads can no longer change.
+    return FOREVER if op and op.get("archived") else THREAD_TTL
 
 
 async def _collect_threads(board: str):
-    uri = _catalog_url(board)
-    async with aiohttp.ClientSession() as session:
-        async with session.get(uri) as response:
-            check_http_status(response.status, uri)
-            for page in await response.json():
-                if "threads" not in page:
-                    continue
-                for thread in _threads_from_page(page):
-                    yield thread
+    threads = client.stream_json(_catalog_url(board), CATALOG_THREADS,
+                                 conditional=True, ttl=CATALOG_TTL)
+    async for thread in threads:
+        yield int(thread.get("no"))
 
 
 async def _collect_posts_thread(board: str, thread: str):
-    uri = _thread_url(board, thread)
-    async with aiohttp.ClientSession() as session:
-        async with session.get(uri) as response:
-            check_http_status(response.status, uri)
-            json = await response.json()
-            for post in json.get("posts", []):
-                _tidy_post_fields(post)
-                yield post
+    posts = client.stream_json(_thread_url(board, thread), THREAD_POSTS,
+                               conditional=True, ttl=_thread_ttl)
+    async for post in posts:
+        yield _make_post(post)
+
+
+async def _sync_board(board: str, collect):
+    state_path = os.path.join(_options.sync_dir,
+                              "4chan-{}.json".format(board))
+    pages = await client.get_json(_threads_index_url(board), conditional=True)
+    async for result in sync_board(state_path, pages,
+                                   lambda thread: collect(board, thread),
+                                   _options.thread_jobs,
+                                   _options.catalog_order,
+                                   skip_failed_thread(board)):
+        yield result
+
 
+def _collect_board(board: str, collect):
+    if _options.sync_dir is not None:
+        return _sync_board(board, collect)
+    return fan_out(
+        _collect_threads(board),
+        lambda thread: collect(board, thread),
+        _options.thread_jobs,
+        _options.catalog_order,
+        skip_failed_thread(board)
+    )
 
-async def _collect_posts_board(board: str):
-    async for thread in _collect_threads(board):
-        for post in _collect_posts_thread(board, thread):
-            yield post
+
+def _collect_posts_board(board: str):
+    return _collect_board(board, _collect_posts_thread)
 
 
 async def _collect_files_thread(board: str, thread: int):
@@ -104,10 +148,15 @@ async def _collect_files_thread(board: str, thread: int):
             yield (post, url)
 
 
-async def _collect_files_board(board: str):
-    async for thread in _collect_threads(board):
-        async for resource in _collect_files_thread(board, thread):
-            yield resource
+def _collect_files_board(board: str):
+    return _collect_board(board, _collect_files_thread)
+
+
+def configure(argv: list):
+    global _options
+    _options, _ = PARSER.parse_known_args(argv)
+    if _options.sync_dir is not None:
+        _common.incremental = True
 
 
 def collect_files(target: tuple):
@@ -23,18 +23,35 @@ __version__ = "0.3.0"
 
 from urllib.parse import quote
 import html
-
-import aiohttp
-
-from chandere.errors import ChandereError, check_http_status
-from chandere.websites._common import contains_uri_scheme, parse_crosslink
+import os
+
+from chandere import client
+from chandere.errors import ChandereError
+from chandere.jsonstream import ITEMS
+from chandere.websites._common import Attachment, Post, base64_to_hex
+from chandere.websites._common import board_parser, contains_uri_scheme
+from chandere.websites._common import Lazy, fan_out
+from chandere.websites._common import parse_crosslink, skip_failed_thread
+from chandere.websites._common import sync_board
 from chandere.websites._common import parse_imageboard_uri_factory
+from chandere.websites import _common
 
 FIELD_NAMES = ["id", "time_posted", "name", "title", "comment", "filename"]
 
 API_BASE = "https://8ch.net"
 RES_BASE = "https://media.8ch.net"
 
+# How long, in seconds, responses may be served from the response cache.
+CATALOG_TTL = 60
+THREAD_TTL = 60
+
+# Where the threads of a catalog and the posts of a thread are found.
+CATALOG_THREADS = (ITEMS, "threads", ITEMS)
+THREAD_POSTS = ("posts", ITEMS)
+
+PARSER = board_parser()
+_options, _ = PARSER.parse_known_args([])
+
 parse_uri = parse_imageboard_uri_factory("net", "res")
 
 
@@ -42,61 +59,91 @@ def _catalog_url(board: str) -> str:
     return API_BASE + "/{}/catalog.json".format(quote(board))
 
 
+def _threads_index_url(board: str) -> str:
+    return API_BASE + "/{}/threads.json".format(quote(board))
+
+
 def _thread_url(board: str, thread: str) -> str:
     return API_BASE + "/{}/res/{}.json".format(board, thread)
 
 
 def _file_url(board: str, tim: str, ext: str) -> str:
     if len(tim) == 64:
-        return RES_BASE + "/file_store/{}{}".format(tim, ext)
-    return RES_BASE + "/{}/src/{}{}".format(board, tim, ext)
+        return RES_BASE + "/file_store/{}.{}".format(tim, ext)
+    return RES_BASE + "/{}/src/{}.{}".format(board, tim, ext)
+
+
+def _comment(comment: str):
+    # Comments without entities have nothing to unescape.
+    return Lazy(html.unescape, comment) if "&" in comment else comment
+
+
+def _make_post(raw: dict) -> Post:
+    post = Post(raw, id=raw.get("no"),
+                thread=raw.get("resto") or raw.get("no"),
+                time_posted=raw.get("time"), name=raw.get("name"),
+                title=raw.get("sub"), comment=_comment(raw.get("com", "")))
+    if "tim" in raw:
+        post.tim = raw["tim"]
+        post.filename = raw.get("filename")
+        post.ext = raw.get("ext", "").lstrip(".")
+        post.fsize = raw.get("fsize")
+        post.md5 = Lazy(base64_to_hex, raw.get("md5"))
+
+    # Files beyond the first are kept, unlike the other raw fields, so
+    # that they can be downloaded.
+    if "extra_files" in raw:
+        post["extra_files"] = [
+            Attachment(post, tim=extra.get("tim"),
+                       filename=extra.get("filename"),
+                       ext=extra.get("ext", "").lstrip("."),
+                       fsize=extra.get("fsize"),
+                       md5=Lazy(base64_to_hex, extra.get("md5")))
+            for extra in raw["extra_files"]
+        ]
+    return post
 
 
-def _tidy_post_fields(post: dict):
-    post["id"] = post.get("no")
-    post["time_posted"] = post.get("time")
-    post["title"] = post.get("sub")
-    post["comment"] = html.unescape(post.get("com"))
-    if "ext" in post and post["ext"][0] == ".":
-        post["ext"] = post["ext"][1:]
+async def _collect_threads(board: str):
+    threads = client.stream_json(_catalog_url(board), CATALOG_THREADS,
+                                 conditional=True, ttl=CATALOG_TTL)
+    async for thread in threads:
+        yield int(thread.get("no"))
 
-    del post["no"]
-    del post["time"]
-    # del post["sub"]
-    del post["com"]
 
+async def _collect_posts_thread(board: str, thread: str):
+    posts = client.stream_json(_thread_url(board, thread), THREAD_POSTS,
+                               conditional=True, ttl=THREAD_TTL)
+    async for post in posts:
+        yield _make_post(post)
 
-def _threads_from_page(page: dict) -> list:
-    return [int(thread.get("no")) for thread in page.get("threads")]
 
+async def _sync_board(board: str, collect):
+    state_path = os.path.join(_options.sync_dir,
+                              "8chan-{}.json".format(board))
+    pages = await client.get_json(_threads_index_url(board), conditional=True)
+    async for result in sync_board(state_path, pages,
+                                   lambda thread: collect(board, thread),
+                                   _options.thread_jobs,
+                                   _options.catalog_order,
+                                   skip_failed_thread(board)):
+        yield result
 
-async def _collect_threads(board: str):
-    uri = _catalog_url(board)
-    async with aiohttp.ClientSession() as session:
-        async with session.get(uri) as response:
-            check_http_status(response.status, uri)
-            for page in await response.json():
-                if "threads" not in page:
-                    continue
-                for thread in _threads_from_page(page):
-                    yield thread
 
+def _collect_board(board: str, collect):
+    if _options.sync_dir is not None:
+        return _sync_board(board, collect)
+    return fan_out(
+        _collect_threads(board),
+        lambda thread: collect(board, thread),
+        _options.thread_jobs,
+        _options.catalog_order,
+        skip_failed_thread(board)
+    )
 
-async def _collect_posts_thread(board: str, thread: str):
-    uri = _thread_url(board, thread)
-    async with aiohttp.ClientSession() as session:
-        async with session.get(uri) as response:
-            check_http_status(response.status, uri)
-            json = await response.json()
-            for post in json.get("posts", []):
-                _tidy_post_fields(post)
-                yield post
 
-
-async def _collect_posts_board(board: str):
-    async for thread in _collect_threads(board):
-        for post in _collect_posts_thread(board, thread):
-            yield post
+def _collect_posts_board(board: str):
+    return _collect_board(board, _collect_posts_thread)
 
 
 async def _collect_files_thread(board: str, thread: int):
@@ -104,17 +151,20 @@ async def _collect_files_thread(board: str, thread: int):
         if "tim" in post and "filename" in post and "ext" in post:
             url = _file_url(board, post.get("tim"), post.get("ext"))
             yield (post, url)
-        for extra in post.get("extra_files", []):
-            url = _file_url(board, extra.get("tim"), extra.get("ext"))
-            new_post = post.copy()
-            new_post["filename"] = extra.get("filename")
-            yield (new_post, url)
+        for attachment in post.get("extra_files", []):
+            url = _file_url(board, attachment.tim, attachment.ext)
+            yield (attachment, url)
+
+
+def _collect_files_board(board: str):
+    return _collect_board(board, _collect_files_thread)
 
 
-async def _collect_files_board(board: str):
-    async for thread in _collect_threads(board):
-        async for resource in _collect_files_thread(board, thread):
-            yield resource
+def configure(argv: list):
+    global _options
+    _options, _ = PARSER.parse_known_args(argv)
+    if _options.sync_dir is not None:
+        _common.incremental = True
 
 
 def collect_files(target: tuple):
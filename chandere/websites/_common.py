@@ -17,8 +17,38 @@
 
 """Common functionality for writing scraper modules."""
 
+from collections.abc import Mapping
 from urllib.parse import quote
+import argparse
+import asyncio
+import base64
+import binascii
+import json
+import os
 import re
+import time
+
+from chandere import client, output
+from chandere.cli import wrap
+from chandere.errors import ChandereError
+
+# Bounds how many results concurrently fetched threads can have waiting
+# to be consumed before they stop fetching.
+FAN_OUT_QUEUE_SIZE = 1024
+
+# The fields that every website maps its posts into. See HACKING.md.
+ATTACHMENT_FIELDS = ("filename", "ext", "fsize", "md5", "tim")
+POST_FIELDS = ("id", "thread", "time_posted", "name", "title",
+               "comment") + ATTACHMENT_FIELDS
+
+# Whether posts keep the fields of the website's API that aren't mapped
+# into the common ones, as requested with --raw-fields.
+keep_raw = False
+
+# Whether only threads that are new or modified since an earlier run are
+# collected, as with --validator-cache or --sync-dir, in which case
+# actions add to what earlier runs wrote rather than starting afresh.
+incremental = False
 
 
 def contains_uri_scheme(target: str) -> bool:
@@ -29,6 +59,121 @@ def contains_uri_scheme(target: str) -> bool:
     return re.search(r":\/\/", target) is not None
 
 
+def base64_to_hex(digest: str):
+    """Converts a base64-encoded digest, which is how 4chan and its
+    derivatives expose file hashes, to a hexadecimal string. Returns None
+    if the digest is missing or malformed.
+    """
+    try:
+        return base64.b64decode(digest, validate=True).hex()
+    except (TypeError, binascii.Error):
+        return None
+
+
+class Lazy:
+    """A field whose value is only computed, by calling function with
+    argument, the first time it is read from a Post. Fields that actions
+    never read, such as a comment left out of --data-format, then cost
+    nothing to decode.
+    """
+    __slots__ = ("function", "argument")
+
+    def __init__(self, function, argument):
+        self.function = function
+        self.argument = argument
+
+
+class _Record(Mapping):
+    """Base for records that behave as read-only dictionaries of their
+    slots, except that keys outside of the slots can be set, and are
+    kept in extra.
+    """
+    __slots__ = ()
+    _fields = ()
+
+    def _missing(self, key):
+        raise KeyError(key)
+
+    def __getitem__(self, key):
+        if key in self._fields:
+            try:
+                value = getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+            if type(value) is Lazy:
+                value = value.function(value.argument)
+                setattr(self, key, value)
+            return value
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        return self._missing(key)
+
+    def __setitem__(self, key, value):
+        if key in self._fields:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __iter__(self):
+        for name in self._fields:
+            if hasattr(self, name):
+                yield name
+        for key in self.extra or ():
+            if key not in self._fields:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return "{}({!r})".format(type(self).__name__, dict(self))
+
+
+class Post(_Record):
+    """A post, mapped from the API of a website into the common fields.
+    Fields that the website doesn't provide are absent, rather than None.
+    The post also holds the fields of its first attached file.
+
+    The raw post from the API is only kept, to look up fields that
+    weren't mapped, if keep_raw is set. Fields that are expensive to
+    decode can be given as Lazy.
+    """
+    __slots__ = POST_FIELDS + ("extra",)
+    _fields = POST_FIELDS
+
+    def __init__(self, raw=None, **fields):
+        self.extra = raw if keep_raw else None
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+
+class Attachment(_Record):
+    """A file attached to a post other than its first, for websites that
+    allow several. The file's own fields are looked up on the attachment
+    and any other field on the post it belongs to, so that the post need
+    not be copied for each of its files.
+    """
+    __slots__ = ATTACHMENT_FIELDS + ("post", "extra")
+    _fields = ATTACHMENT_FIELDS
+
+    def __init__(self, post: Post, **fields):
+        self.post = post
+        self.extra = None
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    def _missing(self, key):
+        return self.post[key]
+
+    def __iter__(self):
+        yield from super().__iter__()
+        for key in self.post:
+            if key not in self._fields and key not in (self.extra or ()):
+                yield key
+
+
 def parse_crosslink(target: str) -> tuple:
     """Parses a target of a format loosely based on the "crosslink"
     feature of imageboards, which is when users reference a post from
@@ -85,3 +230,270 @@ def parse_imageboard_uri_factory(ext: str, thread_dir: str) -> tuple:
         return (board, thread)
 
     return parse_uri
+
+
+def board_parser() -> argparse.ArgumentParser:
+    """Returns an argument parser for the options understood by
+    fan_out and sync_board, for scrapers that collect entire boards.
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument(
+        "--thread-jobs",
+        metavar="N",
+        type=int,
+        default=1,
+        help=wrap(
+            "The number of threads to fetch at the same time when scraping "
+            "an entire board. Defaults to 1."
+        )
+    )
+    parser.add_argument(
+        "--catalog-order",
+        action="store_true",
+        help=wrap(
+            "When fetching several threads at the same time, yield their "
+            "posts in the order the threads appear in the catalog rather than "
+            "in the order they arrive."
+        )
+    )
+    parser.add_argument(
+        "--sync-dir",
+        metavar="DIR",
+        help=wrap(
+            "A directory in which to remember when each thread of a board "
+            "was last modified. Board targets then only fetch threads that "
+            "are new or have changed since the previous run."
+        )
+    )
+    return parser
+
+
+def skip_failed_thread(board: str):
+    """Returns an on_error callback for fan_out that reports a thread
+    that couldn't be collected and records it in the dead-letter list,
+    so that the rest of the board can still be collected.
+    """
+    def on_error(thread, error: ChandereError):
+        output.warning("Skipping thread {}: {}".format(thread, error))
+        client.dead_letters().record_document(
+            getattr(error, "url", None), (board, str(thread)), error
+        )
+    return on_error
+
+
+async def _isolate(item, collect, on_error):
+    try:
+        async for result in collect(item):
+            yield result
+    except ChandereError as e:
+        if on_error is None:
+            raise
+        on_error(item, e)
+
+
+async def fan_out(items, collect, limit: int, ordered=False, on_error=None):
+    """Applies collect, an asynchronous generator function, to every
+    item of an asynchronous iterable, running up to limit of them at
+    the same time and yielding everything they yield.
+
+    Results are yielded as they arrive unless ordered is set, in which
+    case results are yielded in the order of the items that produced
+    them. Results from items that finish ahead of their turn are
+    buffered until then.
+
+    If on_error is given, it is called with the item and the error when
+    collecting an item raises a ChandereError, and the other items carry
+    on. Otherwise, the error is raised.
+    """
+    if limit <= 1:
+        async for item in items:
+            async for result in _isolate(item, collect, on_error):
+                yield result
+        return
+
+    queue = asyncio.Queue(maxsize=FAN_OUT_QUEUE_SIZE)
+    semaphore = asyncio.Semaphore(limit)
+    done = object()
+    tasks = []
+
+    async def drain(index: int, item):
+        try:
+            async for result in _isolate(item, collect, on_error):
+                await queue.put((index, result))
+            await queue.put((index, done))
+        except Exception as e:
+            await queue.put((index, e))
+        finally:
+            semaphore.release()
+
+    async def feed():
+        count = 0
+        async for item in items:
+            await semaphore.acquire()
+            tasks.append(asyncio.ensure_future(drain(count, item)))
+            count += 1
+        return count
+
+    feeder = asyncio.ensure_future(feed())
+    buffered = {}
+    completed = set()
+    next_index = 0
+    finished = 0
+
+    try:
+        while not (feeder.done() and finished == feeder.result()):
+            if feeder.done():
+                index, result = await queue.get()
+            else:
+                get = asyncio.ensure_future(queue.get())
+                await asyncio.wait([get, feeder],
+                                   return_when=asyncio.FIRST_COMPLETED)
+                if not get.done():
+                    get.cancel()
+                    continue
+                index, result = get.result()
+
+            if isinstance(result, Exception):
+                raise result
+
+            if result is done:
+                finished += 1
+                completed.add(index)
+            elif not ordered or index == next_index:
+                yield result
+            else:
+                buffered.setdefault(index, []).append(result)
+
+            # Once the item whose turn it is has finished, the next one's
+            # buffered results can be released.
+            while ordered and next_index in completed:
+                completed.remove(next_index)
+                next_index += 1
+                for buffered_result in buffered.pop(next_index, []):
+                    yield buffered_result
+    finally:
+        feeder.cancel()
+        for task in tasks:
+            task.cancel()
+
+
+class BoardState:
+    """The modification time of every thread on a board as of the last
+    sync, along with the threads that have since been pruned. Stored as
+    JSON at the given path.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.threads = {}
+        self.pruned = {}
+
+        try:
+            with open(path) as state_file:
+                state = json.load(state_file)
+            self.threads = state.get("threads", {})
+            self.pruned = state.get("pruned", {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            error = "Could not read board state '{}': {}"
+            raise ChandereError(error.format(path, e))
+
+    def changed(self, modified: dict) -> list:
+        """Returns the (thread, last_modified) pairs in a mapping of
+        thread numbers to modification times that are new or have been
+        modified since they were last marked.
+        """
+        return [(thread, last_modified)
+                for thread, last_modified in modified.items()
+                if self.threads.get(str(thread)) != last_modified]
+
+    def prune(self, modified: dict) -> list:
+        """Records every known thread that is missing from a mapping of
+        thread numbers to modification times as pruned, returning them.
+        """
+        live = {str(thread) for thread in modified}
+        pruned = [thread for thread in self.threads if thread not in live]
+        for thread in pruned:
+            del self.threads[thread]
+            self.pruned[thread] = int(time.time())
+        return pruned
+
+    def mark(self, thread, last_modified: int):
+        """Records that a thread has been collected as of last_modified."""
+        self.threads[str(thread)] = last_modified
+
+    def save(self):
+        """Writes the state back to disk."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w") as state_file:
+            json.dump({"threads": self.threads, "pruned": self.pruned},
+                      state_file)
+
+
+def modified_from_index(pages: list) -> dict:
+    """Maps thread numbers to modification times from the pages of a
+    "threads.json" index, as served by 4chan and its derivatives.
+    """
+    return {int(thread.get("no")): thread.get("last_modified")
+            for page in pages
+            for thread in page.get("threads", [])}
+
+
+class _Synced:
+    """Marks the end of a thread's results in sync_board."""
+    __slots__ = ("entry",)
+
+    def __init__(self, entry: tuple):
+        self.entry = entry
+
+
+async def _iterate(items: list):
+    for item in items:
+        yield item
+
+
+async def sync_board(state_path: str, pages, collect, limit: int,
+                     ordered=False, on_error=None):
+    """Collects only the threads of a board that are new or modified
+    since the state at state_path was last saved, given the pages of the
+    board's "threads.json" index. A thread is marked as synced once
+    collect has yielded everything it has for it, and threads that have
+    disappeared from the index are recorded as pruned. See fan_out for
+    the remaining arguments.
+    """
+    state = BoardState(state_path)
+
+    # An unmodified index means that no thread has changed.
+    if pages is None:
+        return
+
+    modified = modified_from_index(pages)
+    for thread in state.prune(modified):
+        output.info("Thread {} has been pruned.".format(thread))
+
+    # A thread is only marked once the consumer has taken everything it
+    # yielded, which is when this marker comes out of fan_out after its
+    # results, rather than as soon as they have been queued.
+    async def collect_and_mark(entry: tuple):
+        async for result in collect(entry[0]):
+            yield result
+        yield _Synced(entry)
+
+    try:
+        changed = state.changed(modified)
+        output.info("{} of {} threads have changed.".format(len(changed),
+                                                            len(modified)))
+        if on_error is not None:
+            def on_entry_error(entry: tuple, error: ChandereError):
+                on_error(entry[0], error)
+        else:
+            on_entry_error = None
+
+        async for result in fan_out(_iterate(changed), collect_and_mark,
+                                    limit, ordered, on_entry_error):
+            if isinstance(result, _Synced):
+                state.mark(*result.entry)
+            else:
+                yield result
+    finally:
+        state.save()
@@ -22,52 +22,108 @@ __licence__ = "GPLv3"
 __version__ = "0.1.0"
 
 from dateutil.parser import parse
-import itertools
+import asyncio
+import calendar
+import re
 
-import aiohttp
-
-from chandere.errors import check_http_status
+from chandere import client
+from chandere.websites._common import Lazy, Post
 
 FIELD_NAMES = ["id", "time_posted", "name", "filename"]
 
 API_BASE = "https://danbooru.donmai.us"
 
+# Requests per second and burst size, kept well below the read limits
+# of danbooru's anonymous users.
+RATE_LIMITS = {"danbooru.donmai.us": (2.0, 4)}
+
+# How long, in seconds, pages may be served from the response cache.
+PAGE_TTL = 300
+
+# The most posts that danbooru will return in a single page.
+PAGE_LIMIT = 200
+
+# Timestamps as danbooru formats them, e.g. "2017-12-01T12:34:56.789-05:00".
+ISO_8601 = re.compile(r"(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.\d+)?"
+                      r"(?:(Z)|([+-])(\d\d):?(\d\d))$")
+
+
+def _timestamp(created_at: str) -> int:
+    match = ISO_8601.match(created_at)
+    if match is None:
+        return int(parse(created_at).timestamp())
+
+    timestamp = calendar.timegm([int(field) for field in match.groups()[:6]])
+    if match.group(8) is not None:
+        offset = int(match.group(9)) * 3600 + int(match.group(10)) * 60
+        timestamp += -offset if match.group(8) == "+" else offset
+    return timestamp
+
+
+def _make_post(raw: dict) -> Post:
+    post = Post(raw, id=raw.get("id"), name=raw.get("uploader_name"),
+                time_posted=Lazy(_timestamp, raw.get("created_at")))
+    if "large_file_url" in raw:
+        url = raw.get("large_file_url")
+        post.filename = url[url.rindex("/") + 1:-4]
+    if "file_ext" in raw:
+        post.ext = raw.get("file_ext")
+    if "md5" in raw:
+        post.md5 = raw.get("md5")
+    return post
+
+
+async def _fetch_page(target: str, page: str) -> list:
+    params = {"tags": target, "limit": PAGE_LIMIT, "page": page}
+    return await client.get_json(API_BASE + "/posts.json", params=params,
+                                 ttl=PAGE_TTL)
+
+
+def _next_page(target: str, page: str, posts: list) -> str:
+    # Paging by the last post's id stays fast at any depth, unlike
+    # numbered pages, but only works for results ordered by id.
+    if "order:" in target:
+        return str(int(page) + 1)
+    return "b{}".format(posts[-1].get("id"))
+
+
+async def _collect_raw_posts(target: str):
+    page = "1"
+    fetch = asyncio.ensure_future(_fetch_page(target, page))
+    try:
+        while True:
+            posts = await fetch
+
+            # Empty page - stop searching. Pages can come back short of
+            # the limit while more remain, if posts were hidden.
+            if len(posts) == 0:
+                fetch = None
+                break
 
-def _tidy_post_fields(post: dict):
-    post["name"] = post.get("uploader_name")
-    post["time_posted"] = int(parse(post.get("created_at")).timestamp())
-    if "large_file_url" in post:
-        url = post.get("large_file_url")
-        post["filename"] = url[url.rindex("/") + 1:-4]
-    if "file_ext" in post:
-        post["ext"] = post.get("file_ext")
+            # The next page is fetched while this one is being consumed.
+            page = _next_page(target, page, posts)
+            fetch = asyncio.ensure_future(_fetch_page(target, page))
 
-    del post["uploader_name"]
+            for post in posts:
+                yield post
+    finally:
+        # A prefetched page that is no longer wanted, or failed, is
+        # dropped.
+        if fetch is not None:
+            fetch.cancel()
+            if fetch.done() and not fetch.cancelled():
+                fetch.exception()
 
 
 async def collect_files(target: str):
-    async for post in collect_posts(target):
-        if "large_file_url" in post:
-            yield (post, API_BASE + post.get("large_file_url"))
+    async for raw in _collect_raw_posts(target):
+        if "large_file_url" in raw:
+            yield (_make_post(raw), API_BASE + raw.get("large_file_url"))
 
 
 async def collect_posts(target: str):
-    uri = API_BASE + "/posts.json"
-    params = {"tags": target}
-    async with aiohttp.ClientSession() as session:
-        for i in itertools.count():
-            params["page"] = i
-            async with session.get(uri, params=params) as response:
-                check_http_status(response.status, uri)
-                posts = await response.json()
-
-                # Empty page - stop searching.
-                if len(posts) == 0:
-                    break
-
-                for post in posts:
-                    _tidy_post_fields(post)
-                    yield post
+    async for raw in _collect_raw_posts(target):
+        yield _make_post(raw)
 
 
 def parse_target(target: str) -> str:
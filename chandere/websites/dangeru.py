@@ -23,16 +23,20 @@ __version__ = "0.1.0"
 
 import itertools
 
-import aiohttp
-
-from chandere.errors import ChandereError, check_http_status
-from chandere.websites._common import contains_uri_scheme, parse_crosslink
+from chandere import client
+from chandere.errors import ChandereError
+from chandere.websites._common import Post, contains_uri_scheme
+from chandere.websites._common import parse_crosslink
 from chandere.websites._common import parse_imageboard_uri_factory
 
-FIELD_NAMES = ["no", "time", "hash", "com", "filename"]
+FIELD_NAMES = ["id", "time_posted", "name", "comment"]
 
 API_BASE = "https://dangeru.us/api/v2"
 
+# How long, in seconds, responses may be served from the response cache.
+BOARD_TTL = 60
+THREAD_TTL = 60
+
 parse_uri = parse_imageboard_uri_factory("us", "thread")
 
 
@@ -44,41 +48,32 @@ def _thread_url(thread: str) -> str:
     return API_BASE + "/thread/{}/replies".format(thread)
 
 
-def _tidy_post_fields(post: dict):
-    post["no"] = post.get("post_id")
-    post["com"] = post.get("comment")
-    post["time"] = post.get("date_posted")
+def _make_post(raw: dict, thread: str) -> Post:
+    # Posters are only identified by a hash.
+    return Post(raw, id=raw.get("post_id"), thread=int(thread),
+                time_posted=raw.get("date_posted"), name=raw.get("hash"),
+                comment=raw.get("comment"))
 
 
 async def _collect_posts_thread(board: str, thread: str):
-    async with aiohttp.ClientSession() as session:
-        uri = _thread_url(thread)
-        async with session.get(uri) as response:
-            check_http_status(response.status, uri)
-            for post in await response.json():
-                _tidy_post_fields(post)
-                yield post
+    for post in await client.get_json(_thread_url(thread), ttl=THREAD_TTL):
+        yield _make_post(post, thread)
 
 
 async def _collect_posts_board(board: str):
-    async with aiohttp.ClientSession() as session:
-        for i in itertools.count():
-            params = {"page": i}
-            async with session.get(uri, params=params) as response:
-                threads = response.json()
-
-                # Empty page - stop searching.
-                if len(threads) == 0:
-                    break
-
-                async for post in _thread_foreach(threads):
-                    yield post
-
-
-async def _thread_foreach(threads: list):
-    for thread in threads:
-        async for post in _collect_posts_thread(board, thread.get("post_id")):
-            yield post
+    uri = _catalog_url(board)
+    for i in itertools.count():
+        threads = await client.get_json(uri, params={"page": i},
+                                        ttl=BOARD_TTL)
+
+        # Empty page - stop searching.
+        if len(threads) == 0:
+            break
+
+        for thread in threads:
+            async for post in _collect_posts_thread(board,
+                                                    thread.get("post_id")):
+                yield post
 
 
 def collect_posts(target: tuple):
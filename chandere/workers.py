@@ -0,0 +1,96 @@
+# Copyright (C) 2017 Jakob Kreuze, All Rights Reserved.
+#
+# This file is part of Chandere.
+#
+# Chandere is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Chandere is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Chandere. If not, see <http://www.gnu.org/licenses/>.
+
+"""Running an action in several processes at once, for --workers. Each
+worker collects its share of the targets with an event loop and HTTP
+client of its own, and writes copies of any outputs that the workers
+would otherwise share, which are merged once all of them have finished.
+"""
+
+import multiprocessing
+import os
+import shutil
+
+from chandere.client import ValidatorCache
+
+
+def shard(targets: list, count: int) -> list:
+    """Splits targets into count lists, dealing them out in turn so that
+    the targets given together end up spread across the lists.
+    """
+    return [targets[index::count] for index in range(count)]
+
+
+def run(work, argv: list, count: int) -> list:
+    """Calls work(argv, index, count) in count new processes, returning
+    what each of them returned, in order.
+    """
+    # Workers are started afresh rather than forked, so that none of
+    # them inherits the state of this process's event loop.
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(count) as pool:
+        return pool.starmap(work, [(argv, index, count)
+                                   for index in range(count)])
+
+
+def _merge_dead_letters(path: str, shards: list):
+    with open(path, "a") as letters_file:
+        for shard_path in shards:
+            if os.path.exists(shard_path):
+                with open(shard_path) as shard_file:
+                    shutil.copyfileobj(shard_file, letters_file)
+                os.remove(shard_path)
+
+
+def _merge_validators(path: str, shards: list):
+    validators = ValidatorCache(path)
+    previous = dict(validators.validators)
+
+    # Every worker saved the validators it started with, of which only
+    # those it updated are news.
+    for shard_path in shards:
+        if os.path.exists(shard_path):
+            shard = ValidatorCache(shard_path)
+            validators.validators.update(
+                (key, value) for key, value in shard.validators.items()
+                if previous.get(key) != value
+            )
+            os.remove(shard_path)
+
+    validators.save()
+
+
+def merge(action, args, argv: list, results: list):
+    """Merges the outputs that the workers wrote copies of, given the
+    shard_outputs of each worker in order. The dead-letter file and
+    validator cache are merged here, and anything else is passed to the
+    action's merge function.
+    """
+    outputs = {}
+    for shard_outputs in results:
+        for path, shard_path in shard_outputs.items():
+            outputs.setdefault(path, []).append(shard_path)
+
+    if args.dead_letters in outputs:
+        _merge_dead_letters(args.dead_letters,
+                            outputs.pop(args.dead_letters))
+    if args.validator_cache in outputs:
+        _merge_validators(args.validator_cache,
+                          outputs.pop(args.validator_cache))
+
+    if outputs and hasattr(action, "merge"):
+        action.merge(argv, outputs)
@@ -43,8 +43,8 @@ setup(
     download_url="https://github.com/TsarFox/chandere",
     packages=["chandere"],
     include_package_data=True,
-    install_requires=["aiohttp"],
-    extras_require={},
+    install_requires=["aiohttp>=3.3"],
+    extras_require={"zstd": ["zstandard"]},
     tests_require=["pytest", "tox", "hypothesis"],
     entry_points={"console_scripts": ["chandere = chandere.main:main"]},
     keywords="downloader archiver imageboard",
@@ -0,0 +1,49 @@
+import csv
+import os
+
+import pytest
+
+from chandere.actions import archive_csv
+from chandere.errors import ChandereError
+from conftest import fake_scraper, invoke
+
+
+def _scraper(count: int, threads: int):
+    posts = [{"id": i, "thread": i % threads, "comment": "Post {}".format(i)}
+             for i in range(count)]
+    return fake_scraper(posts, FIELD_NAMES=["id", "comment"])
+
+
+def test_reopened_outputs_keep_one_header(tmpdir):
+    template = os.path.join(str(tmpdir), "{thread}.csv")
+    invoke(archive_csv, _scraper(100, 10), [None],
+           ["-o", template, "--max-open-files", "3"])
+
+    for thread in range(10):
+        with open(template.format(thread=thread), newline="") as archive:
+            rows = list(csv.reader(archive))
+        assert rows[0] == ["id", "comment"]
+        assert [int(row[0]) for row in rows[1:]] == list(range(thread, 100,
+                                                               10))
+
+
+def test_syncing_appends_to_existing_output(tmpdir, monkeypatch):
+    path = str(tmpdir.join("posts.csv"))
+    invoke(archive_csv, _scraper(10, 1), [None], ["-o", path])
+
+    # A later sync only collects what changed, which is added to the rows
+    # written before.
+    monkeypatch.setattr("chandere.websites._common.incremental", True)
+    invoke(archive_csv, _scraper(3, 1), [None], ["-o", path])
+
+    with open(path, newline="") as archive:
+        rows = list(csv.reader(archive))
+    assert rows[0] == ["id", "comment"]
+    assert [int(row[0]) for row in rows[1:]] == list(range(10)) + [0, 1, 2]
+
+
+def test_max_open_files_must_be_positive(tmpdir):
+    path = str(tmpdir.join("posts.csv"))
+    with pytest.raises(ChandereError):
+        invoke(archive_csv, _scraper(10, 1), [None],
+               ["-o", path, "--max-open-files", "0"])
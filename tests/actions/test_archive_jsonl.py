@@ -0,0 +1,87 @@
+import gzip
+import os
+
+import pytest
+
+from chandere.actions import archive_jsonl
+from chandere.loader import load_scraper
+from conftest import fake_scraper, invoke
+
+
+def _scraper(count: int, threads: int):
+    return fake_scraper([{"id": i, "thread": i % threads, "tags": ["a", "b"]}
+                         for i in range(count)])
+
+
+def test_read_thread_from_index(tmpdir):
+    base = str(tmpdir.join("posts"))
+    invoke(archive_jsonl, _scraper(1000, 10), [("g", None)],
+           ["-o", base, "--flush-size", "50"])
+
+    posts = list(archive_jsonl.read_thread(base, "g", 3))
+    assert [post["id"] for post in posts] == list(range(3, 1000, 10))
+    assert posts[0]["tags"] == ["a", "b"]
+
+    # The whole file is still a valid gzip stream.
+    with gzip.open(base + ".0001.jsonl.gz", "rt") as archive:
+        assert sum(1 for _ in archive) == 1000
+
+
+def test_rotation(tmpdir):
+    base = str(tmpdir.join("posts"))
+    argv = ["-o", base, "--flush-size", "100", "--rotate-size", "0",
+            "--compression", "none"]
+    invoke(archive_jsonl, _scraper(300, 1), [("g", None)], argv)
+    invoke(archive_jsonl, _scraper(100, 1), [("g", None)], argv)
+
+    assert sorted(os.listdir(str(tmpdir))) == [
+        "posts.0001.jsonl", "posts.0002.jsonl", "posts.0003.jsonl",
+        "posts.0004.jsonl", "posts.idx"
+    ]
+    assert len(list(archive_jsonl.read_thread(base, "g", 0))) == 400
+
+
+def test_zstd_requires_zstandard(tmpdir):
+    pytest.importorskip("zstandard")
+    base = str(tmpdir.join("posts"))
+    invoke(archive_jsonl, _scraper(100, 5), [("g", None)],
+           ["-o", base, "--compression", "zstd"])
+    assert len(list(archive_jsonl.read_thread(base, "g", 1))) == 20
+
+
+def test_archive_attachments(stub, monkeypatch, tmpdir):
+    monkeypatch.setattr("chandere.websites._common.keep_raw", True)
+    scraper = load_scraper("8chan")
+    base = str(tmpdir.join("posts"))
+
+    async def test(server):
+        await archive_jsonl.invoke(scraper, [("tech", "1000")], ["-o", base])
+
+    stub(test, scraper, "8chan", posts_per_thread=10)
+    posts = list(archive_jsonl.read_thread(base, "tech", 1000))
+    assert len(posts) == 10
+    assert any(post.get("extra_files") for post in posts)
+    extra = next(post for post in posts if post.get("extra_files"))
+    assert set(extra["extra_files"][0]) <= {"filename", "ext", "fsize",
+                                            "md5", "tim"}
+
+
+def test_merge_shards(tmpdir, monkeypatch):
+    base = str(tmpdir.join("posts"))
+    argv = ["-o", base, "--flush-size", "100", "--rotate-size", "0",
+            "--compression", "none"]
+    invoke(archive_jsonl, _scraper(200, 1), [("g", None)], argv)
+
+    # As two worker processes would.
+    for index in range(2):
+        monkeypatch.setattr("chandere.actions._common.shard_index", index)
+        monkeypatch.setattr("chandere.actions._common.shard_outputs", {})
+        invoke(archive_jsonl, _scraper(100, 1), [("g", None)], argv)
+    monkeypatch.setattr("chandere.actions._common.shard_index", None)
+
+    archive_jsonl.merge(argv, {base: [base + ".shard0", base + ".shard1"]})
+    assert sorted(os.listdir(str(tmpdir))) == [
+        "posts.0001.jsonl", "posts.0002.jsonl", "posts.0003.jsonl",
+        "posts.0004.jsonl", "posts.idx"
+    ]
+    assert len(list(archive_jsonl.read_thread(base, "g", 0))) == 400
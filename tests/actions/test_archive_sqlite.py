@@ -0,0 +1,43 @@
+import sqlite3
+
+from chandere.actions import archive_sqlite
+from chandere.loader import load_scraper
+from conftest import fake_scraper, invoke
+
+
+def test_rerun_updates_in_place(tmpdir):
+    path = str(tmpdir.join("posts.db"))
+    posts = [{"id": i, "thread": 1, "time_posted": 1000 + i,
+              "comment": "Post {}".format(i)} for i in range(1, 101)]
+    invoke(archive_sqlite, fake_scraper(posts), [("g", None)],
+           ["-o", path, "--flush-size", "16"])
+
+    posts[4] = dict(posts[4], comment="Edited")
+    posts.append({"id": 101, "thread": 1, "comment": "New"})
+    invoke(archive_sqlite, fake_scraper(posts), [("g", None)], ["-o", path])
+
+    connection = sqlite3.connect(path)
+    rows = connection.execute("SELECT site, board, id, comment FROM posts "
+                              "ORDER BY id").fetchall()
+    assert len(rows) == 101
+    assert rows[0] == ("fake", "g", 1, "Post 1")
+    assert rows[4][3] == "Edited"
+    assert rows[100][3] == "New"
+
+    plan = connection.execute("EXPLAIN QUERY PLAN SELECT id FROM posts "
+                              "WHERE site = 'fake' AND board = 'g' AND "
+                              "thread = 1").fetchall()
+    assert "posts_thread" in str(plan)
+
+
+def test_archive_board(stub, tmpdir):
+    scraper = load_scraper("4chan")
+    path = str(tmpdir.join("posts.db"))
+
+    async def test(server):
+        await archive_sqlite.invoke(scraper, [("g", None)], ["-o", path])
+
+    stub(test, scraper, "4chan", threads=5, posts_per_thread=10)
+    connection = sqlite3.connect(path)
+    assert connection.execute("SELECT COUNT(*), COUNT(DISTINCT thread) "
+                              "FROM posts").fetchone() == (50, 5)
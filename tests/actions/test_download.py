@@ -0,0 +1,352 @@
+import asyncio
+import hashlib
+import sqlite3
+import types
+
+import pytest
+
+from chandere import client, retry
+from chandere.actions import download
+from chandere.errors import ChandereError, HTTPError
+from conftest import fake_scraper, invoke, run
+
+
+def _scraper(count: int):
+    return fake_scraper([{"filename": str(i), "ext": "png"}
+                         for i in range(count)])
+
+
+def test_concurrent_download_indices(monkeypatch):
+    downloaded = {}
+
+    async def fake_download(uri, out_path, size=None):
+        # Finish out of order to make sure indices are assigned up front.
+        await asyncio.sleep(0.01 * (int(uri[3:]) % 3))
+        downloaded[uri] = out_path
+
+    monkeypatch.setattr(download, "_download_file", fake_download)
+    invoke(download, _scraper(20), [None],
+           ["-j", "4", "-o", "{index}-{filename}"])
+
+    assert downloaded == {"uri{}".format(i): "{}-{}".format(i + 1, i)
+                          for i in range(20)}
+
+
+def test_indices_across_targets_are_deterministic(monkeypatch):
+    downloaded = {}
+
+    async def collect_files(target):
+        for i in range(5):
+            # The second target's files arrive first.
+            await asyncio.sleep(0.01 if target == "a" else 0.001)
+            yield ({"filename": "{}{}".format(target, i), "ext": "png"},
+                   "uri-{}{}".format(target, i))
+
+    async def fake_download(uri, out_path, size=None):
+        downloaded[uri] = out_path
+
+    monkeypatch.setattr(download, "_download_file", fake_download)
+    invoke(download, fake_scraper(collect_files=collect_files), ["a", "b"],
+           ["-j", "4", "-o", "{index:03}-{filename}"])
+
+    assert downloaded == {
+        "uri-{}".format(name): "{:03}-{}".format(number, name)
+        for number, name in enumerate(["a0", "a1", "a2", "a3", "a4", "b0",
+                                       "b1", "b2", "b3", "b4"], 1)
+    }
+
+
+def test_worker_indices_are_disjoint(monkeypatch):
+    downloaded = {}
+
+    async def fake_download(uri, out_path, size=None):
+        downloaded.setdefault(out_path, []).append(uri)
+
+    monkeypatch.setattr(download, "_download_file", fake_download)
+    monkeypatch.setattr("chandere.actions._common.shard_count", 3)
+
+    # As each of three worker processes would, with a target apiece.
+    for index in range(3):
+        monkeypatch.setattr("chandere.actions._common.shard_index", index)
+        invoke(download, _scraper(4), [None], ["-o", "{index}.{ext}"])
+
+    assert sorted(downloaded, key=lambda path: int(path.split(".")[0])) == \
+        ["{}.png".format(number) for number in range(1, 13)]
+    assert all(len(uris) == 1 for uris in downloaded.values())
+
+
+def test_uses_index():
+    assert download._uses_index("{index}.{ext}")
+    assert download._uses_index("./{board}/{index:04}-{filename}")
+    assert not download._uses_index("./{filename}.{ext}")
+    assert not download._uses_index("{index_of}.png")
+
+
+def test_failed_download_does_not_cancel_others(monkeypatch):
+    downloaded = []
+
+    async def fake_download(uri, out_path, size=None):
+        if uri == "uri3":
+            raise ChandereError("Encountered HTTP/1.1 404")
+        downloaded.append(uri)
+
+    monkeypatch.setattr(download, "_download_file", fake_download)
+    dead_letters = invoke(download, _scraper(10), [None], ["--jobs", "3"])
+
+    assert sorted(downloaded) == sorted("uri{}".format(i)
+                                        for i in range(10) if i != 3)
+    assert [entry["uri"] for entry in dead_letters.entries] == ["uri3"]
+
+
+def test_transient_failure_is_retried(monkeypatch):
+    attempts = []
+
+    async def fake_download(uri, out_path, size=None):
+        attempts.append(uri)
+        if len(attempts) == 1:
+            raise HTTPError("Encountered HTTP/1.1 502", uri, 502)
+
+    monkeypatch.setattr(download, "_download_file", fake_download)
+    monkeypatch.setattr(retry, "backoff", lambda attempt: 0)
+    dead_letters = invoke(download, _scraper(1), [None], [], retries=2)
+
+    assert attempts == ["uri0", "uri0"]
+    assert dead_letters.entries == []
+
+
+class _FakeResponse:
+    def __init__(self, body: bytes, status=200, headers=None):
+        self.status = status
+        self.headers = headers or {}
+        self.content = types.SimpleNamespace(iter_chunked=self._iter_chunked)
+        self._body = body
+
+    async def _iter_chunked(self, size):
+        for i in range(0, len(self._body), size):
+            yield self._body[i:i + size]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+
+def test_download_is_chunked_and_atomic(monkeypatch, tmpdir):
+    body = bytes(range(256)) * 1000
+    out_path = str(tmpdir.join("file.webm"))
+
+    monkeypatch.setattr(download, "CHUNK_SIZE", 1000)
+    monkeypatch.setattr(download.client, "get",
+                        lambda uri, **kwargs: _FakeResponse(body))
+
+    run(download._download_file("uri", out_path))
+
+    assert tmpdir.join("file.webm").read_binary() == body
+    assert not tmpdir.join("file.webm" + download.PARTIAL_SUFFIX).exists()
+
+
+def test_resume_with_range(monkeypatch, tmpdir):
+    body = b"0123456789"
+    tmpdir.join("a.png" + download.PARTIAL_SUFFIX).write_binary(body[:4])
+    requests = []
+
+    def fake_get(uri, headers=None):
+        requests.append(headers)
+        range_header = {"Content-Range": "bytes 4-9/10"}
+        return _FakeResponse(body[4:], status=206, headers=range_header)
+
+    monkeypatch.setattr(download.client, "get", fake_get)
+    run(download._download_file("uri", str(tmpdir.join("a.png")), 10))
+
+    assert requests == [{"Range": "bytes=4-"}]
+    assert tmpdir.join("a.png").read_binary() == body
+
+
+def test_resume_ignored_by_server(monkeypatch, tmpdir):
+    body = b"0123456789"
+    tmpdir.join("a.png" + download.PARTIAL_SUFFIX).write_binary(b"xxxx")
+
+    monkeypatch.setattr(download.client, "get",
+                        lambda uri, headers=None: _FakeResponse(body))
+    run(download._download_file("uri", str(tmpdir.join("a.png")), 10))
+
+    assert tmpdir.join("a.png").read_binary() == body
+
+
+def test_truncated_download_is_kept(monkeypatch, tmpdir):
+    monkeypatch.setattr(download.client, "get",
+                        lambda uri, headers=None: _FakeResponse(b"01234"))
+
+    with pytest.raises(ChandereError):
+        run(download._download_file("uri", str(tmpdir.join("a.png")), 10))
+
+    assert not tmpdir.join("a.png").exists()
+    assert tmpdir.join("a.png" + download.PARTIAL_SUFFIX).size() == 5
+
+
+def test_digest_mismatch_is_discarded(monkeypatch, tmpdir):
+    body = b"0123456789"
+    monkeypatch.setattr(download.client, "get",
+                        lambda uri, headers=None: _FakeResponse(body))
+
+    with pytest.raises(ChandereError):
+        run(download._download_file("uri", str(tmpdir.join("blob")),
+                                    digest="ab" * 16))
+    run(download._download_file("uri", str(tmpdir.join("blob")),
+                                digest=hashlib.md5(body).hexdigest().upper()))
+
+    assert tmpdir.join("blob").read_binary() == body
+    assert not tmpdir.join("blob" + download.PARTIAL_SUFFIX).exists()
+
+
+def test_resumed_download_is_hashed_whole(monkeypatch, tmpdir):
+    body = b"0123456789"
+    tmpdir.join("blob" + download.PARTIAL_SUFFIX).write_binary(body[:4])
+
+    def fake_get(uri, headers=None):
+        range_header = {"Content-Range": "bytes 4-9/10"}
+        return _FakeResponse(body[4:], status=206, headers=range_header)
+
+    monkeypatch.setattr(download.client, "get", fake_get)
+    run(download._download_file("uri", str(tmpdir.join("blob")), 10,
+                                hashlib.md5(body).hexdigest()))
+
+    assert tmpdir.join("blob").read_binary() == body
+
+
+def test_store_downloads_each_digest_once(monkeypatch, tmpdir):
+    fetched = []
+
+    async def collect_files(target):
+        for i in range(6):
+            post = {"filename": str(i), "ext": "png", "md5": "ab" * 16}
+            yield (post, "uri{}".format(i))
+
+    async def fake_download(uri, out_path, size=None, digest=None):
+        await asyncio.sleep(0.01)
+        fetched.append(uri)
+        with open(out_path, "wb") as out:
+            out.write(b"same")
+
+    monkeypatch.setattr(download, "_download_file", fake_download)
+    scraper = fake_scraper(collect_files=collect_files)
+    invoke(download, scraper, [None],
+           ["-j", "3", "--store", str(tmpdir.join("store")),
+            "-o", str(tmpdir.join("{filename}.{ext}"))])
+
+    assert len(fetched) == 1
+    for i in range(6):
+        assert tmpdir.join("{}.png".format(i)).read_binary() == b"same"
+
+
+def test_manifest_skips_completed_files(monkeypatch, tmpdir):
+    fetched = []
+
+    async def fake_download(uri, out_path, size=None):
+        fetched.append(uri)
+        with open(out_path, "wb") as out:
+            out.write(b"data")
+
+    monkeypatch.setattr(download, "_download_file", fake_download)
+    argv = ["--manifest", str(tmpdir.join("manifest.db")),
+            "-o", str(tmpdir.join("{index}.{ext}"))]
+
+    invoke(download, _scraper(3), [None], argv)
+    invoke(download, _scraper(5), [None], argv)
+
+    assert fetched == ["uri0", "uri1", "uri2", "uri3", "uri4"]
+
+
+def test_unexpected_worker_error_ends_run(monkeypatch, tmpdir):
+    async def fake_download(uri, out_path, size=None):
+        pass
+
+    def broken_record(*args, **kwargs):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(download, "_download_file", fake_download)
+    monkeypatch.setattr(download.Manifest, "record", broken_record)
+    argv = ["--manifest", str(tmpdir.join("manifest.db")), "-j", "2",
+            "-o", str(tmpdir.join("{index}.{ext}"))]
+
+    # Every worker dies while there is still more to queue, which used to
+    # leave the run waiting forever.
+    async def invoke_with_timeout():
+        async with client.Client():
+            await asyncio.wait_for(
+                download.invoke(_scraper(20), [None], argv), 5
+            )
+
+    with pytest.raises(sqlite3.OperationalError):
+        run(invoke_with_timeout())
+
+
+def test_download_against_faulty_server(stub, tmpdir):
+    from chandere.loader import load_scraper
+    from stub_server import media_bytes
+
+    scraper = load_scraper("4chan")
+    argv = ["-j", "4", "-o", str(tmpdir.join("{tim}.{ext}"))]
+
+    async def test(server):
+        await download.invoke(scraper, [("g", "1000")], argv)
+        return client.dead_letters().entries
+
+    dead_letters = stub(test, scraper, "4chan", posts_per_thread=30,
+                        files_every=1, media_size=50000, throttle_every=4,
+                        truncate_every=5, retries=5)
+
+    assert dead_letters == []
+    for tim in range(1000, 1030):
+        path = tmpdir.join("{}.png".format(tim))
+        assert path.read_binary() == media_bytes(tim, 50000)
+
+
+def test_store_against_server_digests(stub, tmpdir):
+    from chandere.loader import load_scraper
+
+    scraper = load_scraper("4chan")
+    argv = ["-j", "4", "--store", str(tmpdir.join("store")),
+            "-o", str(tmpdir.join("{tim}.{ext}"))]
+
+    async def test(server):
+        await download.invoke(scraper, [("g", "1000")], argv)
+        return client.dead_letters().entries
+
+    dead_letters = stub(test, scraper, "4chan", posts_per_thread=10,
+                        files_every=1, media_size=5000)
+
+    assert dead_letters == []
+    assert len(tmpdir.join("store").listdir()) > 0
+    assert tmpdir.join("1009.png").exists()
+
+
+def test_replayed_files_complete_their_manifest_keys(monkeypatch, tmpdir):
+    from chandere.retry import REPLAY_FILES, DeadLetters, Replay
+
+    fetched = []
+    failing = {"uri3"}
+
+    async def fake_download(uri, out_path, size=None):
+        if uri in failing:
+            raise ChandereError("Encountered HTTP/1.1 500")
+        fetched.append(uri)
+        with open(out_path, "wb") as out:
+            out.write(b"data")
+
+    monkeypatch.setattr(download, "_download_file", fake_download)
+    scraper = fake_scraper([{"id": i, "filename": str(i), "ext": "png"}
+                            for i in range(5)])
+    argv = ["--manifest", str(tmpdir.join("manifest.db")),
+            "-o", str(tmpdir.join("{filename}.{ext}"))]
+
+    letters = invoke(download, scraper, [("g", None)], argv)
+    failing.clear()
+    invoke(download, Replay(scraper, DeadLetters(letters.entries)),
+           [REPLAY_FILES], argv)
+    invoke(download, scraper, [("g", None)], argv)
+
+    # The replay completed the file under its board's key, so the last
+    # run has nothing left to fetch.
+    assert fetched == ["uri0", "uri1", "uri2", "uri4", "uri3"]
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from chandere import client
+from chandere.actions._common import collect_targets
+from chandere.errors import HTTPError
+from conftest import run
+
+
+async def _collect(targets: list, collect, limit=None):
+    async with client.Client() as session:
+        results = [pair async for pair in collect_targets(collect, targets,
+                                                          limit)]
+        return results, session.dead_letters.entries
+
+
+def test_small_targets_are_not_starved():
+    sizes = {"big": 200, "small": 3}
+
+    async def collect(target):
+        for i in range(sizes[target]):
+            await asyncio.sleep(0)
+            yield i
+
+    results, _ = run(_collect(["big", "small"], collect, limit=2))
+    assert len(results) == 203
+    positions = [i for i, (target, _) in enumerate(results)
+                 if target == "small"]
+    assert max(positions) < 10
+
+
+def test_limit_bounds_active_targets():
+    active = set()
+    peak = []
+
+    async def collect(target):
+        active.add(target)
+        peak.append(len(active))
+        for i in range(5):
+            await asyncio.sleep(0)
+            yield i
+        active.discard(target)
+
+    results, _ = run(_collect(list(range(10)), collect, limit=3))
+    assert len(results) == 50
+    assert max(peak) == 3
+
+
+def test_failed_target_is_isolated():
+    async def collect(target):
+        yield 1
+        if target == "bad":
+            raise HTTPError("Encountered HTTP/1.1 404", "uri")
+        yield 2
+
+    results, dead_letters = run(_collect(["good", "bad"], collect))
+    assert sorted(results) == [("bad", 1), ("good", 1), ("good", 2)]
+    assert [entry["target"] for entry in dead_letters] == ["bad"]
+
+
+def test_unexpected_errors_propagate():
+    async def collect(target):
+        raise KeyError(target)
+        yield
+
+    with pytest.raises(KeyError):
+        run(_collect(["a"], collect))
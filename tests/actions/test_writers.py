@@ -0,0 +1,101 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from chandere.actions._common import HandlePool, WriterThread
+from conftest import run
+
+
+class _Handle:
+    def __init__(self, path, mode):
+        self.path = path
+        self.mode = mode
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_handle_pool_evicts_least_recently_used():
+    pool = HandlePool(_Handle, max_open=2)
+    a = pool.get("a")
+    pool.get("b")
+    assert pool.get("a") is a
+    pool.get("c")
+    assert not a.closed
+    assert list(pool.handles) == ["a", "c"]
+
+    b = pool.get("b")
+    assert b.mode == "a"
+    assert a.closed
+    pool.close()
+    assert b.closed and not pool.handles
+
+
+def test_writer_thread_batches():
+    batches = []
+    threads = set()
+
+    def write_batch(batch):
+        threads.add(threading.current_thread())
+        batches.append(batch)
+
+    async def write():
+        writer = WriterThread(write_batch, flush_size=4, max_batches=1)
+        for i in range(10):
+            await writer.write(i)
+        writer.close()
+
+    run(write())
+    assert batches == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+    assert threading.current_thread() not in threads
+
+
+def test_writer_thread_flushes_on_interval():
+    batches = []
+
+    async def write():
+        writer = WriterThread(batches.append, flush_interval=0.01)
+        await writer.write(1)
+        await asyncio.sleep(0.1)
+        written = list(batches)
+        writer.close()
+        return written
+
+    assert run(write()) == [[1]]
+
+
+def test_writer_thread_close_keeps_waiting_batch():
+    written = []
+
+    def write_batch(batch):
+        time.sleep(0.3)
+        written.extend(batch)
+
+    async def write():
+        # The thread falls behind, so interval flushes wait for room
+        # while close is called.
+        writer = WriterThread(write_batch, flush_interval=0.05,
+                              max_batches=1)
+        for i in range(5):
+            await writer.write(i)
+            await asyncio.sleep(0.06)
+        writer.close()
+
+    run(write())
+    assert written == [0, 1, 2, 3, 4]
+
+
+def test_writer_thread_raises_errors():
+    def write_batch(batch):
+        raise OSError("disk full")
+
+    async def write():
+        writer = WriterThread(write_batch, flush_size=1)
+        await writer.write(1)
+        with pytest.raises(OSError):
+            writer.close()
+
+    run(write())
@@ -0,0 +1,75 @@
+import asyncio
+import types
+
+import pytest
+
+from chandere import client
+from stub_server import StubServer
+
+
+def run(coroutine):
+    """Runs a coroutine to completion on a fresh event loop."""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def collect(generator) -> list:
+    """Gathers everything an asynchronous generator yields."""
+    return [item async for item in generator]
+
+
+def fake_scraper(posts=(), **attributes):
+    """Returns a stand-in scraper module whose collect_posts yields the
+    given posts for every target, and whose collect_files yields each of
+    them along with the URI uri0, uri1 and so on. Any other attributes,
+    including replacements for either function, are set as given.
+    """
+    async def collect_posts(target):
+        for post in posts:
+            yield post
+
+    async def collect_files(target):
+        for i, post in enumerate(posts):
+            yield (post, "uri{}".format(i))
+
+    attributes.setdefault("collect_posts", collect_posts)
+    attributes.setdefault("collect_files", collect_files)
+    return types.SimpleNamespace(__name__="fake", **attributes)
+
+
+def invoke(action, scraper, targets: list, argv: list, retries=0):
+    """Runs an action over the given targets with a client open,
+    returning the client's dead letters.
+    """
+    async def with_client():
+        async with client.Client(retries=retries) as session:
+            await action.invoke(scraper, targets, argv)
+            return session.dead_letters
+
+    return run(with_client())
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """Returns a function that runs a coroutine function against a fresh
+    StubServer, with a client open and the given scraper module pointed
+    at the server. The server is passed to the coroutine function. The
+    function's collect attribute gathers a scraper's results into a list.
+    """
+    def run_test(test, scraper=None, website=None, retries=3, **options):
+        async def with_server():
+            async with StubServer(**options) as server:
+                if scraper is not None:
+                    server.point(scraper, website, monkeypatch.setattr)
+                async with client.Client(retries=retries):
+                    return await test(server)
+
+        return run(with_server())
+
+    run_test.collect = collect
+    monkeypatch.setattr("chandere.retry.backoff", lambda attempt: 0)
+    monkeypatch.setattr("chandere.client.backoff", lambda attempt: 0)
+    return run_test
@@ -0,0 +1,337 @@
+"""A local stand-in for the APIs of the supported websites, so that
+scrapers and actions can be exercised and measured without touching the
+network. Catalogs, threads, media and danbooru's posts.json are
+synthesized deterministically at a configurable size, or replayed from
+recorded fixtures, and faults such as latency, throttling, truncated
+bodies and slow media can be injected.
+
+    async with StubServer(threads=150, posts_per_thread=300) as server:
+        server.point(scraper, "4chan")
+        ...
+"""
+
+from email.utils import formatdate
+import asyncio
+import base64
+import functools
+import hashlib
+import os
+
+from aiohttp import web
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+# 4chan's epoch for the synthesized threads, 2017-12-01.
+BASE_TIME = 1512086400
+
+MEDIA_CHUNK_SIZE = 16 * 1024
+
+# Every synthesized document claims to have last been modified at this
+# time, so conditional requests can be exercised.
+LAST_MODIFIED = formatdate(BASE_TIME, usegmt=True)
+
+
+@functools.lru_cache(maxsize=1024)
+def media_bytes(key: int, size: int) -> bytes:
+    """Returns the deterministic contents of the synthesized file with
+    the given key.
+    """
+    seed = hashlib.sha256(str(key).encode()).digest()
+    return (seed * (size // len(seed) + 1))[:size]
+
+
+def media_md5(key: int, size: int) -> bytes:
+    return hashlib.md5(media_bytes(key, size)).digest()
+
+
+class StubServer:
+    """An aiohttp server on localhost serving every supported website
+    under its own path prefix.
+
+    Args:
+        threads: The number of threads on every board.
+        posts_per_thread: The number of posts in every thread, including
+            the opening post.
+        files_every: Every nth post has an attached file.
+        media_size: The size in bytes of every synthesized file.
+        distinct_media: If nonzero, files repeat after this many, which
+            lets deduplication be tested.
+        danbooru_posts: The number of posts matching any danbooru tag.
+        latency: Seconds to wait before answering any request.
+        throttle_every: Every nth request is answered with a 429.
+        truncate_every: Every nth response is cut off halfway.
+        media_delay: Seconds to wait between chunks of a file.
+        fixtures: A directory of recorded responses, served in place of
+            synthesized ones where a file exists at the request's path.
+    """
+    def __init__(self, threads=10, posts_per_thread=50, files_every=2,
+                 media_size=4096, distinct_media=0, danbooru_posts=500,
+                 latency=0.0, throttle_every=0, truncate_every=0,
+                 media_delay=0.0, fixtures=FIXTURES):
+        self.threads = threads
+        self.posts_per_thread = posts_per_thread
+        self.files_every = files_every
+        self.media_size = media_size
+        self.distinct_media = distinct_media
+        self.danbooru_posts = danbooru_posts
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.truncate_every = truncate_every
+        self.media_delay = media_delay
+        self.fixtures = fixtures
+
+        self.requests = 0
+        self.bytes_sent = 0
+        self.url = None
+        self.runner = None
+
+    async def __aenter__(self):
+        app = web.Application(middlewares=[self._faults])
+        app.router.add_get("/4chan/{board}/catalog.json", self._catalog)
+        app.router.add_get("/4chan/{board}/threads.json", self._catalog)
+        app.router.add_get("/4chan/{board}/thread/{thread}.json",
+                           self._thread_4chan)
+        app.router.add_get("/4chan/{board}/{tim}.{ext}", self._media)
+        app.router.add_get("/8chan/{board}/catalog.json", self._catalog)
+        app.router.add_get("/8chan/{board}/threads.json", self._catalog)
+        app.router.add_get("/8chan/{board}/res/{thread}.json",
+                           self._thread_8chan)
+        app.router.add_get("/8chan/{board}/src/{tim}.{ext}", self._media)
+        app.router.add_get("/danbooru/posts.json", self._posts_danbooru)
+        app.router.add_get("/danbooru/data/{tim}.{ext}", self._media)
+        app.router.add_get("/dangeru/board/{board}", self._board_dangeru)
+        app.router.add_get("/dangeru/thread/{thread}/replies",
+                           self._thread_dangeru)
+
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = "http://127.0.0.1:{}".format(port)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.runner.cleanup()
+
+    def point(self, scraper, website: str, assign=setattr):
+        """Redirects a scraper module's API_BASE, and RES_BASE if it has
+        one, at this server. assign can be swapped for something like
+        pytest's monkeypatch.setattr to have the change undone later.
+        """
+        assign(scraper, "API_BASE", self.url + "/" + website)
+        if hasattr(scraper, "RES_BASE"):
+            assign(scraper, "RES_BASE", self.url + "/" + website)
+
+    # Fault injection.
+
+    @web.middleware
+    async def _faults(self, request, handler):
+        self.requests += 1
+        count = self.requests
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if self.throttle_every and count % self.throttle_every == 0:
+            return web.Response(status=429, headers={"Retry-After": "0"})
+
+        recorded = self._recorded(request.path)
+        if recorded is not None:
+            response = web.Response(body=recorded,
+                                    content_type="application/json")
+        else:
+            response = await handler(request)
+
+        if response.content_type == "application/json":
+            if request.headers.get("If-Modified-Since") == LAST_MODIFIED:
+                return web.Response(status=304)
+            response.headers["Last-Modified"] = LAST_MODIFIED
+
+        if self.truncate_every and count % self.truncate_every == 0 and \
+           isinstance(response, web.Response) and response.body:
+            return await self._truncate(request, response)
+
+        if isinstance(response, web.Response) and response.body:
+            self.bytes_sent += len(response.body)
+        return response
+
+    def _recorded(self, path: str):
+        if self.fixtures is None:
+            return None
+        fixture = os.path.join(self.fixtures, path.lstrip("/"))
+        if os.path.isfile(fixture):
+            with open(fixture, "rb") as fixture_file:
+                return fixture_file.read()
+        return None
+
+    async def _truncate(self, request, response: web.Response):
+        body = response.body
+        headers = {name: value for name, value in response.headers.items()
+                   if name not in ("Content-Length", "Content-Type")}
+        truncated = web.StreamResponse(status=response.status,
+                                       headers=headers)
+        truncated.content_length = len(body)
+        truncated.content_type = response.content_type
+        await truncated.prepare(request)
+        await truncated.write(body[:len(body) // 2])
+        request.transport.close()
+        return truncated
+
+    # Synthesized content.
+
+    def _media_key(self, tim: int) -> int:
+        if self.distinct_media:
+            return tim % self.distinct_media
+        return tim
+
+    def _thread_numbers(self) -> list:
+        return [1000 * (i + 1) for i in range(self.threads)]
+
+    def _imageboard_post(self, thread: int, index: int) -> dict:
+        no = thread + index
+        post = {
+            "no": no,
+            "resto": 0 if index == 0 else thread,
+            "time": BASE_TIME + no,
+            "name": "Anonymous",
+            "com": "&gt;&gt;{}<br>Post {} in thread {} &amp; more".format(
+                thread, no, thread
+            )
+        }
+        if index == 0:
+            post["sub"] = "Thread {}".format(thread)
+            post["replies"] = self.posts_per_thread - 1
+        if self.files_every and index % self.files_every == 0:
+            key = self._media_key(no)
+            post["tim"] = no
+            post["filename"] = "file{}".format(no)
+            post["ext"] = ".png"
+            post["fsize"] = self.media_size
+            post["md5"] = base64.b64encode(
+                media_md5(key, self.media_size)
+            ).decode()
+        return post
+
+    def _thread_posts(self, thread: int) -> list:
+        return [self._imageboard_post(thread, i)
+                for i in range(self.posts_per_thread)]
+
+    async def _catalog(self, request):
+        threads = self._thread_numbers()
+        pages = []
+        for page in range(0, len(threads), 15):
+            pages.append({
+                "page": page // 15 + 1,
+                "threads": [{"no": thread,
+                             "last_modified": BASE_TIME + thread,
+                             "replies": self.posts_per_thread - 1}
+                            for thread in threads[page:page + 15]]
+            })
+        return web.json_response(pages)
+
+    def _known_thread(self, request) -> int:
+        thread = int(request.match_info["thread"])
+        if thread not in self._thread_numbers():
+            raise web.HTTPNotFound()
+        return thread
+
+    async def _thread_4chan(self, request):
+        thread = self._known_thread(request)
+        return web.json_response({"posts": self._thread_posts(thread)})
+
+    async def _thread_8chan(self, request):
+        thread = self._known_thread(request)
+        posts = self._thread_posts(thread)
+        for post in posts:
+            # 8chan serves its file identifiers as strings.
+            if "tim" in post:
+                post["tim"] = str(post["tim"])
+            if "tim" in post and post["no"] % 3 == 0:
+                tim = int(post["tim"]) + 500
+                post["extra_files"] = [{
+                    "tim": str(tim),
+                    "filename": "extra{}".format(tim),
+                    "ext": ".jpg",
+                    "fsize": self.media_size,
+                    "md5": base64.b64encode(media_md5(
+                        self._media_key(tim), self.media_size
+                    )).decode()
+                }]
+        return web.json_response({"posts": posts})
+
+    async def _media(self, request):
+        try:
+            tim = int(request.match_info["tim"])
+        except ValueError:
+            raise web.HTTPNotFound()
+
+        body = media_bytes(self._media_key(tim), self.media_size)
+        start = 0
+        status = 200
+        headers = {}
+
+        requested = request.headers.get("Range", "")
+        if requested.startswith("bytes=") and requested.endswith("-"):
+            start = int(requested[6:-1])
+            if start >= len(body):
+                return web.Response(status=416)
+            status = 206
+            headers["Content-Range"] = "bytes {}-{}/{}".format(
+                start, len(body) - 1, len(body)
+            )
+
+        if not self.media_delay:
+            return web.Response(status=status, body=body[start:],
+                                headers=headers)
+
+        response = web.StreamResponse(status=status, headers=headers)
+        response.content_length = len(body) - start
+        await response.prepare(request)
+        for offset in range(start, len(body), MEDIA_CHUNK_SIZE):
+            await asyncio.sleep(self.media_delay)
+            await response.write(body[offset:offset + MEDIA_CHUNK_SIZE])
+        self.bytes_sent += len(body) - start
+        return response
+
+    def _danbooru_post(self, post_id: int) -> dict:
+        md5 = media_md5(self._media_key(post_id), self.media_size).hex()
+        return {
+            "id": post_id,
+            "created_at": "2017-12-01T12:{:02}:{:02}.000-05:00".format(
+                post_id // 60 % 60, post_id % 60
+            ),
+            "uploader_name": "uploader{}".format(post_id % 7),
+            "tag_string": "touhou yuri",
+            "md5": md5,
+            "file_ext": "jpg",
+            "file_size": self.media_size,
+            "large_file_url": "/data/{}.jpg".format(post_id)
+        }
+
+    async def _posts_danbooru(self, request):
+        limit = min(int(request.query.get("limit", 20)), 200)
+        page = request.query.get("page", "1")
+
+        # Post IDs run from danbooru_posts down to 1, newest first.
+        if page.startswith("b"):
+            first = min(int(page[1:]) - 1, self.danbooru_posts)
+        else:
+            first = self.danbooru_posts - (max(int(page), 1) - 1) * limit
+        ids = range(first, max(first - limit, 0), -1)
+        return web.json_response([self._danbooru_post(i) for i in ids])
+
+    async def _board_dangeru(self, request):
+        page = int(request.query.get("page", 0))
+        threads = self._thread_numbers()[page * 15:(page + 1) * 15]
+        return web.json_response([{"post_id": thread,
+                                   "title": "Thread {}".format(thread)}
+                                  for thread in threads])
+
+    async def _thread_dangeru(self, request):
+        thread = self._known_thread(request)
+        return web.json_response([
+            {"post_id": thread + i, "comment": "Reply {}".format(i),
+             "date_posted": BASE_TIME + thread + i, "hash": "hash"}
+            for i in range(self.posts_per_thread)
+        ])
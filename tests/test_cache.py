@@ -0,0 +1,65 @@
+# Copyright (C) 2017 Jakob Kreuze, All Rights Reserved.
+#
+# This file is part of Chandere.
+#
+# Chandere is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Chandere is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Chandere. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+
+from chandere.cache import FOREVER, ResponseCache
+
+
+def test_get_and_put(tmpdir):
+    cache = ResponseCache(str(tmpdir))
+    assert cache.get("uri") is None
+
+    cache.put("uri", {"posts": [1, 2, 3]}, 60)
+    assert cache.get("uri") == {"posts": [1, 2, 3]}
+
+    cache = ResponseCache(str(tmpdir))
+    assert cache.get("uri") == {"posts": [1, 2, 3]}
+
+    cache.put_text("text", '{"posts": [4]}', 60)
+    assert cache.get("text") == {"posts": [4]}
+
+
+def test_expiry(tmpdir):
+    cache = ResponseCache(str(tmpdir))
+    cache.put("stale", [1], -1)
+    cache.put("archived", [2], FOREVER)
+    assert cache.get("stale") is None
+    assert cache.get("archived") == [2]
+
+
+def test_lru_eviction(tmpdir):
+    cache = ResponseCache(str(tmpdir), max_bytes=1000)
+    document = ["x" * 100]
+
+    for i in range(5):
+        cache.put("uri{}".format(i), document, FOREVER)
+        # Keep modification times distinct on coarse filesystems.
+        path = cache._path("uri{}".format(i))
+        os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+
+    # Using the oldest entry makes it the most recently used.
+    assert cache.get("uri0") == document
+
+    for i in range(5, 10):
+        cache.put("uri{}".format(i), document, FOREVER)
+
+    assert cache.size <= 1000
+    assert cache.get("uri0") == document
+    assert cache.get("uri1") is None
+    assert cache.get("uri9") == document
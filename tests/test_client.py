@@ -0,0 +1,41 @@
+# Copyright (C) 2017 Jakob Kreuze, All Rights Reserved.
+#
+# This file is part of Chandere.
+#
+# Chandere is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Chandere is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Chandere. If not, see <http://www.gnu.org/licenses/>.
+
+from chandere.client import ValidatorCache, _cache_key
+
+
+def test_cache_key():
+    assert _cache_key("https://a.4cdn.org/g/catalog.json") == \
+        "https://a.4cdn.org/g/catalog.json"
+    assert _cache_key("https://x/posts.json", {"tags": "a", "page": 2}) == \
+        "https://x/posts.json?page=2&tags=a"
+
+
+def test_validator_headers(tmpdir):
+    path = str(tmpdir.join("validators.json"))
+    validators = ValidatorCache(path)
+    assert validators.headers("uri") == {}
+
+    validators.update("uri", {"Last-Modified": "Sat, 16 Dec 2017 00:00:00 GMT",
+                              "ETag": '"abc"', "Content-Length": "12"})
+    validators.save()
+
+    validators = ValidatorCache(path)
+    assert validators.headers("uri") == {
+        "If-Modified-Since": "Sat, 16 Dec 2017 00:00:00 GMT",
+        "If-None-Match": '"abc"'
+    }
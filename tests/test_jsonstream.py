@@ -0,0 +1,81 @@
+# Copyright (C) 2017 Jakob Kreuze, All Rights Reserved.
+#
+# This file is part of Chandere.
+#
+# Chandere is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Chandere is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Chandere. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import json
+
+import pytest
+
+from chandere.jsonstream import ITEMS, items, select
+
+THREAD = {"posts": [{"no": 1, "com": "café \"quoted\" [1, 2]"},
+                    {"no": 22, "sub": None, "replies": 1.5e3},
+                    {"no": 333, "files": [{"ext": ".png"}]}]}
+CATALOG = [{"page": 1, "threads": [{"no": 10}, {"no": 11}]},
+           {"page": 2, "threads": []},
+           {"page": 3},
+           {"page": 4, "threads": [{"no": 12}]}]
+
+
+async def _chunks(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def _stream(document, path: tuple, size: int, text=None) -> list:
+    data = (text or json.dumps(document, indent=1)).encode("utf-8")
+
+    async def collect():
+        return [item async for item in items(_chunks(data, size), path)]
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(collect())
+    finally:
+        loop.close()
+
+
+def test_items_at_every_chunk_size():
+    for size in range(1, 40):
+        assert _stream(THREAD, ("posts", ITEMS), size) == THREAD["posts"]
+        assert _stream(CATALOG, (ITEMS, "threads", ITEMS), size) == \
+            [{"no": 10}, {"no": 11}, {"no": 12}]
+
+
+def test_items_split_number():
+    assert _stream(None, (ITEMS,), 3, text="[12345, 678]") == [12345, 678]
+    assert _stream(None, (ITEMS,), 2, text="[12345]") == [12345]
+
+
+def test_items_missing_path():
+    assert _stream({"other": [1]}, ("posts", ITEMS), 4) == []
+    assert _stream([], ("posts", ITEMS), 4) == []
+
+
+def test_items_malformed():
+    text = json.dumps(THREAD)
+    with pytest.raises(json.JSONDecodeError):
+        _stream(None, ("posts", ITEMS), 8, text=text[:len(text) // 2])
+    with pytest.raises(json.JSONDecodeError):
+        _stream(None, ("posts", ITEMS), 8, text=text + " {}")
+
+
+def test_select():
+    assert list(select(THREAD, ("posts", ITEMS))) == THREAD["posts"]
+    assert list(select(CATALOG, (ITEMS, "threads", ITEMS))) == \
+        [{"no": 10}, {"no": 11}, {"no": 12}]
+    assert list(select({}, ("posts", ITEMS))) == []
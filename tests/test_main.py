@@ -0,0 +1,111 @@
+# Copyright (C) 2017 Jakob Kreuze, All Rights Reserved.
+#
+# This file is part of Chandere.
+#
+# Chandere is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Chandere is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Chandere. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import csv
+import sys
+import threading
+
+import pytest
+
+from chandere import main
+
+# A scraper that trickles out posts for as long as it is asked to.
+SCRAPER = '''
+import asyncio
+
+FIELD_NAMES = ["id"]
+
+
+def parse_target(target):
+    return target
+
+
+async def collect_posts(target):
+    number = 0
+    while True:
+        await asyncio.sleep(0.005)
+        yield {"id": number}
+        number += 1
+'''
+
+# A scraper whose every target has gone missing.
+FAILING_SCRAPER = '''
+from chandere.errors import HTTPError
+
+FIELD_NAMES = ["id"]
+
+
+def parse_target(target):
+    return target
+
+
+async def collect_posts(target):
+    raise HTTPError("Encountered HTTP/1.1 404", None, 404)
+    yield
+'''
+
+
+def _interrupt():
+    raise KeyboardInterrupt
+
+
+def test_interrupted_run_writes_what_it_has(tmpdir, monkeypatch):
+    scraper = tmpdir.join("trickle.py")
+    scraper.write(SCRAPER)
+    path = str(tmpdir.join("posts.csv"))
+    monkeypatch.setattr(sys, "argv", [
+        "chandere", "--custom-scraper", str(scraper), "g", "-a",
+        "archive_csv", "-o", path, "--flush-size", "100000",
+        "--flush-interval", "60"
+    ])
+
+    # Interrupted while posts are still waiting to be handed to the
+    # writer thread, as by a Ctrl-C.
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.call_later(0.2, _interrupt)
+    try:
+        main.main()
+    finally:
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
+    assert threading.active_count() == 1
+    with open(path, newline="") as archive:
+        rows = list(csv.DictReader(archive))
+    assert len(rows) > 0
+    assert [int(row["id"]) for row in rows] == list(range(len(rows)))
+
+
+def test_skipped_targets_fail_the_run(tmpdir, monkeypatch):
+    scraper = tmpdir.join("missing.py")
+    scraper.write(FAILING_SCRAPER)
+    monkeypatch.setattr("chandere.actions._common.skipped_targets", 0)
+    monkeypatch.setattr(sys, "argv", [
+        "chandere", "--custom-scraper", str(scraper), "g", "-a",
+        "archive_csv", "-o", str(tmpdir.join("posts.csv"))
+    ])
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        with pytest.raises(SystemExit) as exit_info:
+            main.main()
+    finally:
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
+    assert exit_info.value.code == 1
@@ -0,0 +1,68 @@
+# Copyright (C) 2017 Jakob Kreuze, All Rights Reserved.
+#
+# This file is part of Chandere.
+#
+# Chandere is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Chandere is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Chandere. If not, see <http://www.gnu.org/licenses/>.
+
+from chandere.manifest import Manifest, target_board
+
+KEY = ("4chan", "g", "51971506", "5eb63bbbe01eeed093cb22bb8f5acdc3")
+
+
+def test_target_board():
+    assert target_board(("g", "51971506")) == "g"
+    assert target_board(("g", None)) == "g"
+    assert target_board("touhou") == "touhou"
+
+
+def test_record_and_lookup(tmpdir):
+    path = str(tmpdir.join("manifest.db"))
+    manifest = Manifest(path)
+    assert manifest.lookup(KEY) is None
+
+    manifest.record(KEY, "out.png", complete=False)
+    assert not manifest.is_complete(KEY, "out.png")
+
+    manifest.record(KEY, "out.png", 1024, complete=True)
+    manifest.close()
+
+    manifest = Manifest(path)
+    assert manifest.lookup(KEY) == ("out.png", 1024, True)
+    assert manifest.is_complete(KEY, "out.png")
+    assert not manifest.is_complete(KEY, "elsewhere.png")
+    manifest.close()
+
+
+def test_base_and_merge(tmpdir):
+    path = str(tmpdir.join("manifest.db"))
+    shard = str(tmpdir.join("manifest.db.shard0"))
+    other = KEY[:3] + ("d41d8cd98f00b204e9800998ecf8427e",)
+
+    manifest = Manifest(path)
+    manifest.record(KEY, "out.png", 1024, complete=True)
+    manifest.close()
+
+    # A worker's manifest sees what earlier runs recorded, but only
+    # writes to its own file.
+    manifest = Manifest(shard, base=path)
+    assert manifest.is_complete(KEY, "out.png")
+    manifest.record(other, "other.png", 2048, complete=True)
+    manifest.close()
+
+    manifest = Manifest(path)
+    assert manifest.lookup(other) is None
+    manifest.merge(shard)
+    assert manifest.lookup(other) == ("other.png", 2048, True)
+    assert manifest.lookup(KEY) == ("out.png", 1024, True)
+    manifest.close()
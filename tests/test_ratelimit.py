@@ -0,0 +1,79 @@
+# Copyright (C) 2017 Jakob Kreuze, All Rights Reserved.
+#
+# This file is part of Chandere.
+#
+# Chandere is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Chandere is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Chandere. If not, see <http://www.gnu.org/licenses/>.
+
+import time
+
+from chandere.ratelimit import RateLimiter, TokenBucket, backoff
+from chandere.ratelimit import parse_retry_after
+from conftest import run
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("120") == 120
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def test_backoff():
+    for attempt in range(20):
+        assert 0 < backoff(attempt) <= 120
+
+
+def test_token_bucket_rate():
+    bucket = TokenBucket(50, 2)
+
+    async def acquire(count: int):
+        for _ in range(count):
+            await bucket.acquire()
+
+    start = time.monotonic()
+    run(acquire(7))
+    # Two tokens are available up front, the other five take 1/50s each.
+    assert time.monotonic() - start >= 0.09
+
+
+def test_token_bucket_throttle():
+    bucket = TokenBucket(100, 1)
+    bucket.throttled(0.05)
+    assert bucket.rate == 50
+
+    start = time.monotonic()
+    run(bucket.acquire())
+    assert time.monotonic() - start >= 0.05
+
+    for _ in range(100):
+        bucket.succeeded()
+    assert bucket.rate == 100
+
+
+def test_rate_limiter_buckets():
+    limiter = RateLimiter({"a.4cdn.org": (1.0, 1)})
+    assert limiter.bucket("a.4cdn.org").rate == 1.0
+    assert limiter.bucket("i.4cdn.org").rate is None
+    assert limiter.bucket("a.4cdn.org") is limiter.bucket("a.4cdn.org")
+
+    limiter = RateLimiter(default=(5.0, 2))
+    assert limiter.bucket("i.4cdn.org").rate == 5.0
+
+
+def test_rate_limiter_shares():
+    limiter = RateLimiter({"a.4cdn.org": (1.0, 1)}, (8.0, 4), shares=4)
+    assert limiter.bucket("a.4cdn.org").rate == 0.25
+    assert limiter.bucket("a.4cdn.org").burst == 1
+    assert limiter.bucket("i.4cdn.org").rate == 2.0
+    assert limiter.bucket("i.4cdn.org").burst == 1
@@ -0,0 +1,93 @@
+# Copyright (C) 2017 Jakob Kreuze, All Rights Reserved.
+#
+# This file is part of Chandere.
+#
+# Chandere is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Chandere is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Chandere. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+
+import aiohttp
+import pytest
+
+from chandere import retry
+from chandere.errors import ChandereError, HTTPError
+from chandere.retry import REPLAY_FILES, DeadLetters, Replay, is_retryable
+from conftest import run
+
+
+def test_is_retryable():
+    assert is_retryable(HTTPError("", status=502))
+    assert is_retryable(HTTPError(""))
+    assert is_retryable(aiohttp.ServerDisconnectedError())
+    assert is_retryable(asyncio.TimeoutError())
+    assert not is_retryable(HTTPError("", status=404))
+    assert not is_retryable(ChandereError(""))
+    assert not is_retryable(KeyError())
+
+
+def test_retry_gives_up(monkeypatch):
+    monkeypatch.setattr(retry, "backoff", lambda attempt: 0)
+    attempts = []
+
+    async def operation():
+        attempts.append(None)
+        raise HTTPError("Encountered HTTP/1.1 500", status=500)
+
+    with pytest.raises(HTTPError):
+        run(retry.retry(operation, 3))
+    assert len(attempts) == 4
+
+
+def test_retry_fatal_error(monkeypatch):
+    attempts = []
+
+    async def operation():
+        attempts.append(None)
+        raise HTTPError("Encountered HTTP/1.1 404", status=404)
+
+    with pytest.raises(HTTPError):
+        run(retry.retry(operation, 3))
+    assert len(attempts) == 1
+
+
+def test_dead_letters_replay(tmpdir):
+    path = str(tmpdir.join("dead.jsonl"))
+    letters = DeadLetters()
+    letters.record_document("https://a.4cdn.org/g/thread/1.json", ("g", "1"),
+                            HTTPError("Encountered HTTP/1.1 500"))
+    letters.record_file("https://i.4cdn.org/g/2.png",
+                        {"filename": "2", "ext": "png", "extra": object()},
+                        "timed out", ("4chan", "g", "2", "uri"))
+    letters.save(path)
+
+    class Scraper:
+        __name__ = "scraper"
+
+        @staticmethod
+        async def collect_files(target):
+            yield ({"filename": target[1], "ext": "png"}, "uri")
+
+    replay = Replay(Scraper, DeadLetters.load(path))
+    assert replay.targets() == [("g", "1"), REPLAY_FILES]
+    assert not hasattr(replay, "collect_posts")
+    assert replay.file_key("https://i.4cdn.org/g/2.png") == \
+        ("4chan", "g", "2", "uri")
+
+    async def collect(target):
+        return [resource async for resource in replay.collect_files(target)]
+
+    assert run(collect(("g", "1"))) == [({"filename": "1", "ext": "png"},
+                                         "uri")]
+    assert run(collect(REPLAY_FILES)) == [({"filename": "2", "ext": "png"},
+                                           "https://i.4cdn.org/g/2.png")]
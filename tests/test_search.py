@@ -0,0 +1,69 @@
+# Copyright (C) 2017 Jakob Kreuze, All Rights Reserved.
+#
+# This file is part of Chandere.
+#
+# Chandere is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Chandere is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Chandere. If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+
+from chandere.actions.archive_sqlite import Archive
+from chandere.errors import ChandereError
+from chandere.search import _timestamp, search
+
+POSTS = [
+    ("4chan", "g", {"id": 1, "thread": 1, "time_posted": 100,
+                    "title": "Thinkpad thread", "comment": "Post your x220"}),
+    ("4chan", "g", {"id": 2, "thread": 1, "time_posted": 200,
+                    "comment": "My x220 runs linux"}),
+    ("4chan", "v", {"id": 3, "thread": 3, "time_posted": 300,
+                    "comment": "linux gaming"}),
+]
+
+
+def _ids(results: list) -> list:
+    return sorted(result["id"] for result in results)
+
+
+def test_search_filters(tmpdir):
+    archive = Archive(str(tmpdir.join("posts.db")), search_index=True)
+    archive.write(POSTS)
+
+    assert _ids(search(archive.connection, "x220")) == [1, 2]
+    assert _ids(search(archive.connection, "linux", board="v")) == [3]
+    assert _ids(search(archive.connection, "linux", since=150,
+                       until=300)) == [2]
+    assert _ids(search(archive.connection, "thinkpad")) == [1]
+    with pytest.raises(ChandereError):
+        search(archive.connection, "AND")
+
+
+def test_index_follows_updates(tmpdir):
+    path = str(tmpdir.join("posts.db"))
+    archive = Archive(path)
+    archive.write(POSTS)
+    archive.close()
+
+    # Posts archived before the index existed are indexed when it's made.
+    archive = Archive(path, search_index=True)
+    assert _ids(search(archive.connection, "linux")) == [2, 3]
+
+    archive.write([("4chan", "v", dict(POSTS[2][2], comment="edited"))])
+    assert _ids(search(archive.connection, "linux")) == [2]
+    assert _ids(search(archive.connection, "edited")) == [3]
+
+
+def test_timestamp():
+    assert _timestamp("1512086400") == 1512086400
+    assert _timestamp("2017-12-01") == 1512086400
+    assert _timestamp("2017-12-01T00:01") == 1512086460
@@ -0,0 +1,57 @@
+# Copyright (C) 2017 Jakob Kreuze, All Rights Reserved.
+#
+# This file is part of Chandere.
+#
+# Chandere is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Chandere is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Chandere. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+
+import pytest
+
+from chandere.errors import ChandereError
+from chandere.store import BlobStore
+
+DIGEST = "5eb63bbbe01eeed093cb22bb8f5acdc3"
+
+
+@pytest.mark.parametrize("mode", ["hardlink", "symlink", "reflink"])
+def test_link(tmpdir, mode):
+    store = BlobStore(str(tmpdir.join("store")), mode)
+    with open(store.blob_path(DIGEST), "wb") as blob:
+        blob.write(b"hello world")
+
+    out_path = str(tmpdir.join("out.png"))
+    store.link(DIGEST, out_path)
+    store.link(DIGEST, out_path)
+
+    assert store.contains(DIGEST)
+    assert tmpdir.join("out.png").read_binary() == b"hello world"
+    assert os.path.islink(out_path) == (mode == "symlink")
+
+
+def test_unknown_link_mode(tmpdir):
+    with pytest.raises(ChandereError):
+        BlobStore(str(tmpdir), "teleport")
+
+
+def test_reflink_without_fcntl(tmpdir, monkeypatch):
+    # As on platforms without fcntl, such as Windows.
+    monkeypatch.setitem(sys.modules, "fcntl", None)
+    store = BlobStore(str(tmpdir.join("store")), "reflink")
+    with open(store.blob_path(DIGEST), "wb") as blob:
+        blob.write(b"hello world")
+
+    store.link(DIGEST, str(tmpdir.join("out.png")))
+    assert tmpdir.join("out.png").read_binary() == b"hello world"
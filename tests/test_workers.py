@@ -0,0 +1,97 @@
+# Copyright (C) 2017 Jakob Kreuze, All Rights Reserved.
+#
+# This file is part of Chandere.
+#
+# Chandere is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Chandere is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with Chandere. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import csv
+import sqlite3
+import sys
+
+import pytest
+
+from chandere import main
+from chandere.workers import shard
+
+# A scraper that makes up 50 posts for each target without touching the
+# network, so that worker processes can load it from a file.
+SCRAPER = '''
+FIELD_NAMES = ["id", "comment"]
+
+
+def parse_target(target):
+    return target
+
+
+async def collect_posts(target):
+    for number in range(50):
+        yield {"id": "{}-{}".format(target, number), "thread": target,
+               "comment": "post {} of {}".format(number, target)}
+'''
+
+TARGETS = ["a", "b", "c", "d", "e"]
+
+
+def _run(tmpdir, monkeypatch, *argv):
+    scraper = tmpdir.join("made_up.py")
+    scraper.write(SCRAPER)
+    monkeypatch.setattr(sys, "argv", ["chandere", "--custom-scraper",
+                                      str(scraper), "--workers", "3"]
+                        + TARGETS + list(argv))
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    try:
+        main.main()
+    finally:
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
+
+def test_shard():
+    assert shard(list(range(7)), 3) == [[0, 3, 6], [1, 4], [2, 5]]
+
+
+def test_workers_archive_csv(tmpdir, monkeypatch):
+    path = str(tmpdir.join("posts.csv"))
+    _run(tmpdir, monkeypatch, "-a", "archive_csv", "-o", path)
+
+    with open(path, newline="") as posts_file:
+        rows = list(csv.DictReader(posts_file))
+    assert sorted(row["id"] for row in rows) == \
+        sorted("{}-{}".format(target, number)
+               for target in TARGETS for number in range(50))
+    assert [name.basename for name in tmpdir.listdir()
+            if "shard" in name.basename] == []
+
+
+def test_workers_archive_sqlite(tmpdir, monkeypatch):
+    path = str(tmpdir.join("posts.db"))
+    _run(tmpdir, monkeypatch, "-a", "archive_sqlite", "-o", path,
+         "--search-index")
+
+    connection = sqlite3.connect(path)
+    assert connection.execute("SELECT COUNT(*) FROM posts").fetchone() == \
+        (len(TARGETS) * 50,)
+    matches = connection.execute("SELECT COUNT(*) FROM posts_fts WHERE "
+                                 "posts_fts MATCH '\"of c\"'").fetchone()
+    assert matches == (50,)
+    connection.close()
+    assert [name.basename for name in tmpdir.listdir()
+            if "shard" in name.basename] == []
+
+
+def test_workers_error(tmpdir, monkeypatch):
+    # Each worker fails to open the archive, and so does the run.
+    path = str(tmpdir.join("missing", "posts.db"))
+    with pytest.raises(SystemExit):
+        _run(tmpdir, monkeypatch, "-a", "archive_sqlite", "-o", path)
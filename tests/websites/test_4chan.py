@@ -62,3 +62,69 @@ def test_parse_invalid_crosslink_target():
     for target in INVALID_CROSSLINK_TARGETS:
         with pytest.raises(ChandereError):
             scraper.parse_target(target)
+
+
+def test_collect_posts_thread(stub):
+    async def test(server):
+        return await stub.collect(scraper.collect_posts(("g", "1000")))
+
+    posts = stub(test, scraper, "4chan", posts_per_thread=20)
+    assert [post["id"] for post in posts] == list(range(1000, 1020))
+    assert posts[0]["title"] == "Thread 1000"
+    assert posts[1]["comment"].startswith(">>1000<br>")
+    assert len(posts[0]["md5"]) == 32
+    assert posts[0]["ext"] == "png"
+
+
+def test_collect_recorded_thread(stub):
+    async def test(server):
+        return await stub.collect(scraper.collect_posts(("po", "570368")))
+
+    posts = stub(test, scraper, "4chan")
+    assert [post["id"] for post in posts] == [570368, 570369, 570370]
+    assert "everything that's relevant" in posts[0]["comment"]
+    assert posts[2]["md5"] == "d41d8cd98f00b204e9800998ecf8427e"
+
+
+def test_collect_board(stub, monkeypatch):
+    monkeypatch.setattr(scraper, "_options",
+                        scraper.PARSER.parse_known_args(["--thread-jobs",
+                                                         "4"])[0])
+
+    async def collect_posts(server):
+        return await stub.collect(scraper.collect_posts(("g", None)))
+
+    async def collect_files(server):
+        return await stub.collect(scraper.collect_files(("g", None)))
+
+    options = {"threads": 20, "posts_per_thread": 10, "files_every": 2}
+    posts = stub(collect_posts, scraper, "4chan", **options)
+    files = stub(collect_files, scraper, "4chan", **options)
+    assert len(posts) == 200
+    assert len({post["id"] for post in posts}) == 200
+    assert len(files) == 100
+
+
+def test_conditional_thread_request(stub):
+    async def test(server):
+        first = await stub.collect(scraper.collect_posts(("g", "1000")))
+        second = await stub.collect(scraper.collect_posts(("g", "1000")))
+        return first, second, server.requests
+
+    first, second, requests = stub(test, scraper, "4chan", posts_per_thread=5)
+    assert len(first) == 5
+    assert second == []
+    assert requests == 2
+
+
+def test_truncated_thread_resumes(stub):
+    async def test(server):
+        # The second response is cut off halfway.
+        await stub.collect(scraper.collect_posts(("g", "1000")))
+        posts = await stub.collect(scraper.collect_posts(("g", "2000")))
+        return posts, server.requests
+
+    posts, requests = stub(test, scraper, "4chan", posts_per_thread=200,
+                           truncate_every=2)
+    assert [post["id"] for post in posts] == list(range(2000, 2200))
+    assert requests == 3
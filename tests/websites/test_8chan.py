@@ -58,3 +58,20 @@ def test_parse_invalid_crosslink_target():
     for target in INVALID_CROSSLINK_TARGETS:
         with pytest.raises(ChandereError):
             scraper.parse_target(target)
+
+
+def test_collect_files_thread(stub):
+    async def test(server):
+        return await stub.collect(scraper.collect_files(("tech", "1000")))
+
+    files = stub(test, scraper, "8chan", posts_per_thread=10, files_every=2)
+    urls = [url for _, url in files]
+
+    # Posts 1000, 1002, 1004, 1006 and 1008 have files, and 1002 and 1008
+    # each have one extra.
+    assert len(files) == 7
+    assert urls[0].endswith("/tech/src/1000.png")
+    assert urls[2].endswith("/tech/src/1502.jpg")
+    assert files[2][0]["filename"] == "extra1502"
+    assert files[2][0]["ext"] == "jpg"
+    assert files[1][0]["filename"] == "file1002"
@@ -0,0 +1,199 @@
+import asyncio
+
+import pytest
+
+from chandere.errors import ChandereError
+from chandere.websites._common import Attachment, BoardState, Lazy, Post
+from chandere.websites._common import base64_to_hex, fan_out
+from chandere.websites._common import modified_from_index, sync_board
+from conftest import run
+
+
+async def _items(count: int):
+    for i in range(count):
+        yield i
+
+
+def _collect_factory(running: list, limit=4):
+    async def collect(item: int):
+        running.append(item)
+        assert len(running) <= limit
+        for i in range(3):
+            # Later items finish first.
+            await asyncio.sleep(0.001 * (10 - item))
+            yield (item, i)
+        running.remove(item)
+    return collect
+
+
+async def _fan_out(count: int, ordered: bool, limit=4):
+    collect = _collect_factory([], limit)
+    return [result async for result in fan_out(_items(count), collect,
+                                               limit, ordered)]
+
+
+def test_fan_out_completion_order():
+    results = run(_fan_out(10, False))
+    assert sorted(results) == [(item, i) for item in range(10)
+                               for i in range(3)]
+    assert results != sorted(results)
+
+
+def test_fan_out_catalog_order():
+    results = run(_fan_out(10, True))
+    assert results == [(item, i) for item in range(10) for i in range(3)]
+
+
+def test_fan_out_sequential():
+    # One item at a time, so even unordered results come in item order,
+    # though later items would finish first if run together.
+    results = run(_fan_out(5, False, limit=1))
+    assert results == [(item, i) for item in range(5) for i in range(3)]
+    assert run(_fan_out(0, True, limit=1)) == []
+
+
+def test_fan_out_propagates_errors():
+    async def collect(item: int):
+        if item == 3:
+            raise ValueError(item)
+        yield item
+
+    async def consume():
+        return [result async for result in fan_out(_items(10), collect, 4)]
+
+    with pytest.raises(ValueError):
+        run(consume())
+
+
+def test_base64_to_hex():
+    assert base64_to_hex("XrY7u+Ae7tCTyyK7j1rNww==") == \
+        "5eb63bbbe01eeed093cb22bb8f5acdc3"
+    assert base64_to_hex("not base64!") is None
+    assert base64_to_hex(None) is None
+
+
+def test_board_state(tmpdir):
+    path = str(tmpdir.join("state", "g.json"))
+    state = BoardState(path)
+    index = [{"page": 1, "threads": [{"no": 1, "last_modified": 100},
+                                     {"no": 2, "last_modified": 200}]}]
+
+    modified = modified_from_index(index)
+    assert state.changed(modified) == [(1, 100), (2, 200)]
+    state.mark(1, 100)
+    state.mark(2, 200)
+    state.save()
+
+    state = BoardState(path)
+    modified = {1: 100, 2: 250, 3: 300}
+    assert state.changed(modified) == [(2, 250), (3, 300)]
+
+    assert state.prune({2: 250, 3: 300}) == ["1"]
+    assert "1" in state.pruned
+
+
+def test_sync_board_marks_collected_threads(tmpdir):
+    path = str(tmpdir.join("g.json"))
+    index = [{"threads": [{"no": 1, "last_modified": 100},
+                          {"no": 2, "last_modified": 200}]}]
+
+    async def collect(thread):
+        yield thread
+
+    async def consume():
+        return [thread async for thread in sync_board(path, index, collect,
+                                                      2, True)]
+
+    assert run(consume()) == [1, 2]
+    assert run(consume()) == []
+
+
+def test_sync_board_aborted_run(tmpdir):
+    path = str(tmpdir.join("g.json"))
+    index = [{"threads": [{"no": thread, "last_modified": 100}
+                          for thread in range(1, 6)]}]
+
+    async def collect(thread):
+        for i in range(3):
+            yield (thread, i)
+
+    async def consume_one():
+        results = sync_board(path, index, collect, 4)
+        result = await results.__anext__()
+        await asyncio.sleep(0.01)
+        await results.aclose()
+        return result
+
+    # The other threads were queued but never consumed, so none of them
+    # count as synced.
+    run(consume_one())
+    assert BoardState(path).threads == {}
+
+    async def consume():
+        return [result async for result in sync_board(path, index, collect,
+                                                      4)]
+
+    assert len(run(consume())) == 15
+    assert len(BoardState(path).threads) == 5
+
+
+def test_fan_out_on_error():
+    failed = []
+
+    async def collect(item: int):
+        if item % 3 == 0:
+            raise ChandereError(item)
+        yield item
+
+    def on_error(item: int, error: ChandereError):
+        failed.append(item)
+
+    async def consume(limit: int):
+        return [result async for result in fan_out(_items(7), collect, limit,
+                                                   True, on_error)]
+
+    assert run(consume(1)) == [1, 2, 4, 5]
+    assert run(consume(3)) == [1, 2, 4, 5]
+    assert failed == [0, 3, 6, 0, 3, 6]
+
+
+def test_post_mapping(monkeypatch):
+    raw = {"no": 1, "sub": None, "country": "US"}
+    post = Post(raw, id=1, title=None, comment="text")
+    assert dict(post) == {"id": 1, "title": None, "comment": "text"}
+    assert "filename" not in post
+    assert post.get("country") is None
+    assert "{id}: {comment}".format(**post) == "1: text"
+
+    post["index"] = 0
+    assert post["index"] == 0
+    assert list(post) == ["id", "title", "comment", "index"]
+
+    monkeypatch.setattr("chandere.websites._common.keep_raw", True)
+    post = Post(raw, id=1)
+    assert post["country"] == "US"
+    assert post["id"] == 1
+
+
+def test_attachment_falls_back_to_post():
+    post = Post(id=1, filename="first", ext="png", fsize=10)
+    attachment = Attachment(post, filename="second", ext="jpg")
+    assert attachment["id"] == 1
+    assert attachment["filename"] == "second"
+    assert "fsize" not in attachment
+    assert dict(attachment) == {"filename": "second", "ext": "jpg", "id": 1}
+
+
+def test_lazy_field():
+    calls = []
+
+    def decode(value):
+        calls.append(value)
+        return value.upper()
+
+    post = Post(id=1, comment=Lazy(decode, "text"))
+    assert "{id}".format_map(post) == "1"
+    assert calls == []
+    assert post["comment"] == "TEXT"
+    assert post.get("comment") == "TEXT"
+    assert calls == ["text"]
@@ -1,3 +1,4 @@
+from dateutil.parser import parse
 import pytest
 
 from chandere.errors import ChandereError
@@ -14,3 +15,34 @@ VALID_TARGETS = [
 def test_parse_valid_targets():
     for target, expected in VALID_TARGETS:
         assert scraper.parse_target(target) == expected
+
+
+def test_collect_posts(stub):
+    async def test(server):
+        return await stub.collect(scraper.collect_posts("touhou"))
+
+    posts = stub(test, scraper, "danbooru", danbooru_posts=95)
+    assert [post["id"] for post in posts] == list(range(95, 0, -1))
+    assert posts[0]["name"] == "uploader4"
+    assert posts[0]["filename"] == "95"
+    assert posts[0]["ext"] == "jpg"
+
+
+def test_collect_posts_cursor_pages(stub):
+    async def test(server):
+        posts = await stub.collect(scraper.collect_posts("touhou"))
+        return posts, server.requests
+
+    # Three full pages and a short one, then an empty one to finish.
+    posts, requests = stub(test, scraper, "danbooru", danbooru_posts=650)
+    assert [post["id"] for post in posts] == list(range(650, 0, -1))
+    assert requests == 5
+
+
+def test_timestamp():
+    for created_at in ["2017-12-01T12:34:56.789-05:00",
+                       "2017-12-01T12:34:56+09:30",
+                       "2017-12-01T12:34:56Z",
+                       "2017-12-01T12:34:56.1+0000"]:
+        assert scraper._timestamp(created_at) == \
+            int(parse(created_at).timestamp())
@@ -0,0 +1,23 @@
+from chandere.loader import load_scraper
+
+scraper = load_scraper("dangeru")
+
+
+def test_parse_target():
+    assert scraper.parse_target("/tech/1000") == ("tech", "1000")
+    assert scraper.parse_target("https://dangeru.us/tech/thread/1000") == \
+        ("tech", "1000")
+
+
+def test_collect_posts(stub):
+    async def test(server):
+        thread = await stub.collect(scraper.collect_posts(("tech", "1000")))
+        board = await stub.collect(scraper.collect_posts(("tech", None)))
+        return thread, board
+
+    thread, board = stub(test, scraper, "dangeru", threads=20,
+                         posts_per_thread=5)
+    assert [post["id"] for post in thread] == list(range(1000, 1005))
+    assert thread[1]["comment"] == "Reply 1"
+    assert thread[1]["thread"] == 1000
+    assert len(board) == 100